@@ -1,91 +1,272 @@
-from fastapi import APIRouter, Query
-from app.db import audit_logs
-from app.crypto_utils import decrypt_log, sha256_hex, canonical_enc
-from cryptography.exceptions import InvalidTag
+from fastapi import APIRouter, Query, HTTPException
+from fastapi.responses import StreamingResponse
+from app.db import audit_logs, async_audit_logs
+from app.crypto_utils import decrypt_many, blind_index, BLIND_INDEX_KEY
+from app.audit_chain import verify_chain, VERIFY_PROJECTION
+from app.audit_checkpoints import latest_valid_checkpoint, save_checkpoint
+from app.audit_batches import get_inclusion_proof
+from app.lru_cache import LRUCache
+from app.metrics import track_cache
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import base64
 import json
+import os
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+# ================= CONFIG =================
 
-@router.get("/audit-logs")
-def get_audit_logs(limit: int = Query(20, le=100)):
-    logs = []
-    skipped = 0
+AUDIT_PAGE_MAX = int(os.getenv("AUDIT_PAGE_MAX", "1000"))
+AUDIT_DECRYPT_WORKERS = int(os.getenv("AUDIT_DECRYPT_WORKERS", "4"))
+AUDIT_DECRYPT_CHUNK = 256
+# Each window is split across the decrypt workers
+AUDIT_DECRYPT_TASK = max(1, AUDIT_DECRYPT_CHUNK // AUDIT_DECRYPT_WORKERS)
+AUDIT_DECRYPT_CACHE_SIZE = int(os.getenv("AUDIT_DECRYPT_CACHE_SIZE", "2048"))
 
-    cursor = audit_logs.find().sort("created_at", -1).limit(limit)
+LIST_PROJECTION = {"seq": 1, "enc": 1, "hash": 1, "prev_hash": 1}
 
-    for d in cursor:
-        enc = d.get("enc")
-        if not enc:
-            skipped += 1
+# record hash -> decrypted log entry (records are immutable)
+decrypted_cache = LRUCache(AUDIT_DECRYPT_CACHE_SIZE)
+track_cache("audit_decrypted", decrypted_cache)
+_decrypt_pool = ThreadPoolExecutor(
+    max_workers=AUDIT_DECRYPT_WORKERS,
+    thread_name_prefix="audit-decrypt",
+)
+
+# ================= HELPERS =================
+
+def _encode_cursor(seq: int) -> str:
+    raw = json.dumps({"s": seq}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["s"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, "invalid cursor")
+
+
+def _decrypt_records(chunk: list) -> list:
+    entries = [None] * len(chunk)
+    misses = []
+
+    for i, d in enumerate(chunk):
+        log_hash = d.get("hash")
+        cached = decrypted_cache.get(log_hash) if log_hash else None
+
+        if cached is not None:
+            entries[i] = cached
+        elif d.get("enc"):
+            misses.append(i)
+
+    plaintexts = decrypt_many(
+        [chunk[i]["enc"] for i in misses],
+        executor=_decrypt_pool,
+        chunk_size=AUDIT_DECRYPT_TASK,
+    )
+
+    for i, plaintext in zip(misses, plaintexts):
+        if isinstance(plaintext, Exception):
             continue
 
         try:
-            plaintext = decrypt_log(enc)
             data = json.loads(plaintext)
+        except ValueError:
+            continue
+
+        d = chunk[i]
+        entries[i] = {
+            **data,
+            "seq": d.get("seq"),
+            "hash": d.get("hash"),
+            "prev_hash": d.get("prev_hash"),
+        }
+
+        if d.get("hash"):
+            decrypted_cache.set(d["hash"], entries[i])
+
+    return entries
+
+
+async def _decrypt_chunk(chunk: list):
+    entries = await asyncio.to_thread(_decrypt_records, chunk)
+    return zip(chunk, entries)
+
+
+async def _iter_decrypted(docs):
+    # Decrypts a bounded window at a time, preserving order
+    chunk = []
+
+    async for d in docs:
+        chunk.append(d)
+        if len(chunk) >= AUDIT_DECRYPT_CHUNK:
+            for pair in await _decrypt_chunk(chunk):
+                yield pair
+            chunk = []
+
+    if chunk:
+        for pair in await _decrypt_chunk(chunk):
+            yield pair
+
+
+def _page_query(cursor: str | None, filters: dict) -> dict:
+    query = {}
+
+    if cursor is not None:
+        query["seq"] = {"$lt": _decode_cursor(cursor)}
+
+    if filters and BLIND_INDEX_KEY is None:
+        raise HTTPException(400, "filtering requires AUDIT_BLIND_INDEX_KEY")
+
+    for field, value in filters.items():
+        query[f"bidx.{field}"] = blind_index(field, value)
+
+    return query
+
+
+def _matches(entry: dict, filters: dict) -> bool:
+    # Guards against truncated-HMAC collisions and tampered bidx fields
+    return all(str(entry.get(field)) == value for field, value in filters.items())
+
+
+# ================= LISTING =================
+
+@router.get("/audit-logs")
+async def get_audit_logs(
+    limit: int = Query(20, ge=1),
+    cursor: str | None = Query(None),
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    user_id: str | None = Query(None),
+    device_id: str | None = Query(None),
+    action: str | None = Query(None),
+    status: str | None = Query(None),
+):
+    """
+    Newest-first keyset pagination over seq. Pass back `next_cursor` to
+    get the following page. format=ndjson streams one record per line
+    (no page cap) and ends with a {"_meta": ...} line.
+
+    user_id / device_id / action / status are resolved through the
+    blind-index fields, so only matching records are decrypted.
+    """
+    filters = {
+        field: value
+        for field, value in (
+            ("user_id", user_id),
+            ("device_id", device_id),
+            ("action", action),
+            ("status", status),
+        )
+        if value is not None
+    }
+    query = _page_query(cursor, filters)
+
+    if output == "ndjson":
+        docs = async_audit_logs.find(query, projection=LIST_PROJECTION).sort("seq", -1).limit(limit)
+        return StreamingResponse(
+            _stream_ndjson(docs, limit, filters),
+            media_type="application/x-ndjson",
+        )
+
+    if limit > AUDIT_PAGE_MAX:
+        raise HTTPException(400, f"limit must be <= {AUDIT_PAGE_MAX}; use format=ndjson for larger ranges")
+
+    docs = async_audit_logs.find(query, projection=LIST_PROJECTION).sort("seq", -1).limit(limit)
+
+    logs = []
+    skipped = 0
+    fetched = 0
+    last_seq = None
 
-            logs.append({
-                **data,
-                "hash": d.get("hash"),
-                "prev_hash": d.get("prev_hash"),
-            })
+    async for d, entry in _iter_decrypted(docs):
+        fetched += 1
+        last_seq = d.get("seq")
 
-        except (InvalidTag, ValueError, KeyError):
+        if entry is None or not _matches(entry, filters):
             skipped += 1
+        else:
+            logs.append(entry)
 
     return {
         "returned": len(logs),
         "skipped": skipped,
         "logs": logs,
+        "next_cursor": _encode_cursor(last_seq) if fetched == limit and last_seq else None,
     }
 
 
-@router.get("/audit-logs/verify")
-def verify_audit_chain():
-    prev_hash = "GENESIS"
-    index = 0
-
-    cursor = audit_logs.find().sort("created_at", 1)
-
-    for d in cursor:
-        enc = d.get("enc")
-        stored_prev = d.get("prev_hash")
-        stored_hash = d.get("hash")
-
-        if not enc or not stored_prev or not stored_hash:
-            return {
-                "ok": False,
-                "error": "Missing fields",
-                "index": index,
-            }
-
-        if stored_prev != prev_hash:
-            return {
-                "ok": False,
-                "error": "Broken prev_hash",
-                "index": index,
-                "expected_prev": prev_hash,
-                "found_prev": stored_prev,
-            }
-
-        expected_hash = sha256_hex(
-            (prev_hash + canonical_enc(enc)).encode()
-        )
+async def _stream_ndjson(docs, limit: int, filters: dict):
+    returned = 0
+    skipped = 0
+    fetched = 0
+    last_seq = None
 
-        if stored_hash != expected_hash:
-            return {
-                "ok": False,
-                "error": "Hash mismatch",
-                "index": index,
-                "expected_hash": expected_hash,
-                "found_hash": stored_hash,
-            }
+    async for d, entry in _iter_decrypted(docs):
+        fetched += 1
+        last_seq = d.get("seq")
 
-        prev_hash = stored_hash
-        index += 1
+        if entry is None or not _matches(entry, filters):
+            skipped += 1
+            continue
 
-    return {
-        "ok": True,
-        "records_verified": index,
-        "root_hash": prev_hash,
+        returned += 1
+        yield json.dumps(entry, separators=(",", ":")) + "\n"
+
+    meta = {
+        "returned": returned,
+        "skipped": skipped,
+        "next_cursor": _encode_cursor(last_seq) if fetched == limit and last_seq else None,
     }
+    yield json.dumps({"_meta": meta}, separators=(",", ":")) + "\n"
+
+
+# ================= VERIFICATION =================
+
+@router.get("/audit-logs/verify")
+def verify_audit_chain(full: bool = Query(False)):
+    checkpoint = None if full else latest_valid_checkpoint()
+
+    if checkpoint:
+        prev_hash = checkpoint["hash"]
+        start_seq = checkpoint["seq"] + 1
+    else:
+        prev_hash = "GENESIS"
+        start_seq = 1
+
+    cursor = audit_logs.find(
+        {"seq": {"$gte": start_seq}},
+        projection=VERIFY_PROJECTION,
+    ).sort("seq", 1)
+
+    result = verify_chain(cursor, prev_hash, index=start_seq - 1)
+    result["resumed_from_seq"] = start_seq - 1
+
+    if not result["ok"]:
+        return result
+
+    head_seq = result.pop("head_seq")
+    result["records_hashed"] = result["records_verified"] - (start_seq - 1)
+
+    if head_seq > start_seq - 1:
+        save_checkpoint(head_seq, result["root_hash"])
+
+    result["checkpoint_seq"] = head_seq
+    return result
+
+
+# ================= PROOFS =================
+
+@router.get("/audit-logs/{seq}/proof")
+def get_audit_proof(seq: int):
+    try:
+        proof = get_inclusion_proof(seq)
+    except ValueError as e:
+        raise HTTPException(409, str(e))
+
+    if proof is None:
+        raise HTTPException(404, "audit record not found")
+
+    return proof
@@ -0,0 +1,64 @@
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519, padding
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+# JOSE names, so they can go straight into the JWT header
+RS256 = "RS256"
+ES256 = "ES256"
+EDDSA = "EdDSA"
+
+
+def generate_private_key(alg: str):
+    if alg == RS256:
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if alg == ES256:
+        return ec.generate_private_key(ec.SECP256R1())
+    if alg == EDDSA:
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Unsupported algorithm {alg}")
+
+
+def algorithm_for_key(key) -> str:
+    """The signature algorithm implied by a private or public key."""
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return RS256
+
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        if isinstance(key.curve, ec.SECP256R1):
+            return ES256
+        raise ValueError(f"Unsupported EC curve {key.curve.name}")
+
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return EDDSA
+
+    raise ValueError(f"Unsupported key type {type(key).__name__}")
+
+
+def sign(private_key, message: bytes) -> bytes:
+    alg = algorithm_for_key(private_key)
+
+    if alg == RS256:
+        return private_key.sign(message, padding.PKCS1v15(), hashes.SHA256())
+    if alg == ES256:
+        return private_key.sign(message, ec.ECDSA(hashes.SHA256()))
+    return private_key.sign(message)
+
+
+def verify(public_key, signature: bytes, message: bytes):
+    """Raises cryptography's InvalidSignature on mismatch."""
+    alg = algorithm_for_key(public_key)
+
+    if alg == RS256:
+        public_key.verify(signature, message, padding.PKCS1v15(), hashes.SHA256())
+
+    elif alg == ES256:
+        # WebCrypto emits raw r||s; cryptography expects DER
+        if len(signature) == 64:
+            signature = encode_dss_signature(
+                int.from_bytes(signature[:32], "big"),
+                int.from_bytes(signature[32:], "big"),
+            )
+        public_key.verify(signature, message, ec.ECDSA(hashes.SHA256()))
+
+    else:
+        public_key.verify(signature, message)
@@ -0,0 +1,238 @@
+import os
+import threading
+from datetime import datetime
+
+from app.db import audit_logs, audit_batches, get_audit_head
+from app.audit_signer import sign_root_hash
+from app.merkle import leaf_hash, merkle_root, inclusion_proof
+
+# ===============================
+# CONFIG
+# ===============================
+
+AUDIT_MERKLE_BATCH_SIZE = int(os.getenv("AUDIT_MERKLE_BATCH_SIZE", "1024"))
+
+# A full power-of-two tree has no promoted nodes, so the left/right path
+# of an inclusion proof pins the leaf's position (and thus its seq)
+if AUDIT_MERKLE_BATCH_SIZE < 1 or AUDIT_MERKLE_BATCH_SIZE & (AUDIT_MERKLE_BATCH_SIZE - 1):
+    raise RuntimeError("AUDIT_MERKLE_BATCH_SIZE must be a power of two")
+
+# The sealer wakes at least this often, and at most this many batches
+# are sealed per wake-up, so an upgraded log's history is sealed gradually
+AUDIT_SEAL_INTERVAL = float(os.getenv("AUDIT_SEAL_INTERVAL", "1"))   # seconds
+AUDIT_SEAL_MAX_BATCHES = int(os.getenv("AUDIT_SEAL_MAX_BATCHES", "4"))
+
+
+# ===============================
+# HELPERS
+# ===============================
+
+def batch_for_seq(seq: int) -> int:
+    return (seq - 1) // AUDIT_MERKLE_BATCH_SIZE
+
+
+def batch_range(batch: int) -> tuple[int, int]:
+    first_seq = batch * AUDIT_MERKLE_BATCH_SIZE + 1
+    return first_seq, first_seq + AUDIT_MERKLE_BATCH_SIZE - 1
+
+
+def signed_message(first_seq: int, last_seq: int, root: str) -> str:
+    # Binds the covered seq range into the signed root
+    return f"{first_seq}-{last_seq}:{root}"
+
+
+def _batch_hashes(batch: int) -> list[str]:
+    first_seq, last_seq = batch_range(batch)
+
+    cursor = audit_logs.find(
+        {"seq": {"$gte": first_seq, "$lte": last_seq}},
+        projection={"_id": 0, "seq": 1, "hash": 1, "prev_hash": 1},
+    ).sort("seq", 1)
+
+    hashes = []
+    expected_seq = first_seq
+
+    for d in cursor:
+        if d["seq"] != expected_seq:
+            raise ValueError(f"Missing audit record seq {expected_seq}")
+        if hashes and d.get("prev_hash") != hashes[-1]:
+            raise ValueError(f"Broken prev_hash at seq {d['seq']}")
+
+        hashes.append(d["hash"])
+        expected_seq += 1
+
+    if len(hashes) != AUDIT_MERKLE_BATCH_SIZE:
+        raise ValueError(f"Batch {batch} is incomplete")
+
+    return hashes
+
+
+# ===============================
+# SEALING
+# ===============================
+
+def seal_batch(batch: int) -> dict:
+    existing = audit_batches.find_one({"batch": batch}, {"_id": 0})
+    if existing:
+        return existing
+
+    first_seq, last_seq = batch_range(batch)
+    root = merkle_root([leaf_hash(h) for h in _batch_hashes(batch)]).hex()
+    signed = sign_root_hash(signed_message(first_seq, last_seq, root))
+
+    doc = {
+        "batch": batch,
+        "first_seq": first_seq,
+        "last_seq": last_seq,
+        "root": root,
+        "timestamp": signed["timestamp"],
+        "signature": signed["signature"],
+        "alg": signed["alg"],
+        "created_at": datetime.utcnow(),
+    }
+
+    audit_batches.update_one(
+        {"batch": batch},
+        {"$setOnInsert": doc},
+        upsert=True,
+    )
+    return audit_batches.find_one({"batch": batch}, {"_id": 0})
+
+
+def mark_unsealable(batch: int, error: str):
+    # Recorded in place of a root so later batches can still be sealed
+    first_seq, last_seq = batch_range(batch)
+
+    audit_batches.update_one(
+        {"batch": batch},
+        {"$setOnInsert": {
+            "batch": batch,
+            "first_seq": first_seq,
+            "last_seq": last_seq,
+            "error": error,
+            "created_at": datetime.utcnow(),
+        }},
+        upsert=True,
+    )
+
+
+def seal_pending_batches(limit: int | None = None) -> int:
+    """
+    Seals up to `limit` complete batches after the last recorded one.
+    A batch whose records don't form a chain (e.g. a legacy fork) is
+    marked unsealable and skipped. Returns how many are still pending.
+    """
+    head_seq, _ = get_audit_head()
+    complete = head_seq // AUDIT_MERKLE_BATCH_SIZE
+
+    last = audit_batches.find_one(sort=[("batch", -1)], projection={"batch": 1})
+    next_batch = last["batch"] + 1 if last else 0
+
+    end = complete if limit is None else min(complete, next_batch + limit)
+
+    for batch in range(next_batch, end):
+        try:
+            seal_batch(batch)
+        except ValueError as e:
+            print(f"Audit batch {batch} cannot be sealed:", e)
+            mark_unsealable(batch, str(e))
+
+    return max(0, complete - end)
+
+
+class BatchSealer:
+    """
+    Seals completed Merkle batches on its own thread, off the audit
+    writer. notify() wakes it early when a flush completes a batch;
+    otherwise it polls every AUDIT_SEAL_INTERVAL, which also picks up
+    batches written by other workers.
+    """
+
+    def __init__(self, interval: float, max_batches: int):
+        self.interval = interval
+        self.max_batches = max_batches
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="audit-sealer",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        thread = self._thread
+        if not thread:
+            return
+
+        self._stopping.set()
+        self._wake.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                pending = seal_pending_batches(self.max_batches)
+            except Exception as e:
+                print("Merkle batch sealing failed:", e)
+                pending = 0
+
+            if pending:
+                # Working through a backlog: keep the pace, ignore wake-ups
+                self._stopping.wait(self.interval)
+            else:
+                self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+batch_sealer = BatchSealer(
+    interval=AUDIT_SEAL_INTERVAL,
+    max_batches=AUDIT_SEAL_MAX_BATCHES,
+)
+
+
+# ===============================
+# PROOFS
+# ===============================
+
+def get_inclusion_proof(seq: int):
+    """
+    Returns None when `seq` does not exist, raises ValueError when its
+    batch is not complete yet.
+    """
+    record = audit_logs.find_one({"seq": seq}, projection={"hash": 1})
+    if not record:
+        return None
+
+    batch = batch_for_seq(seq)
+    sealed = audit_batches.find_one({"batch": batch}, {"_id": 0, "created_at": 0})
+    if not sealed:
+        sealed = seal_batch(batch)
+        sealed.pop("created_at", None)
+
+    if "error" in sealed:
+        raise ValueError(f"Batch {batch} cannot be sealed: {sealed['error']}")
+
+    leaves = [leaf_hash(h) for h in _batch_hashes(batch)]
+    index = seq - sealed["first_seq"]
+
+    return {
+        "seq": seq,
+        "hash": record["hash"],
+        "leaf_index": index,
+        "proof": inclusion_proof(leaves, index),
+        "batch": sealed,
+    }
+
@@ -0,0 +1,185 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+from app.crypto_utils import chain_hash
+
+# ===============================
+# CONFIG
+# ===============================
+
+AUDIT_VERIFY_WORKERS = int(os.getenv("AUDIT_VERIFY_WORKERS", str(os.cpu_count() or 1)))
+AUDIT_VERIFY_CHUNK = int(os.getenv("AUDIT_VERIFY_CHUNK", "5000"))
+
+# Only what the hash and linkage checks need
+VERIFY_PROJECTION = {"seq": 1, "enc": 1, "prev_hash": 1, "hash": 1}
+
+_pool = None
+
+
+# ===============================
+# HASHING
+# ===============================
+
+def _expected_hashes(items):
+    # items: [(stored_prev_hash, enc)]; runs inside pool workers.
+    # Malformed records get None, which the linkage check reports
+    expected = []
+
+    for prev, enc in items:
+        try:
+            expected.append(chain_hash(prev, enc) if prev and enc else None)
+        except (KeyError, TypeError, ValueError):
+            expected.append(None)
+
+    return expected
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: the parent holds Mongo / writer threads that must not be forked
+        _pool = ProcessPoolExecutor(
+            max_workers=AUDIT_VERIFY_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_verify_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def _discard_pool(pool):
+    # A worker died (OOM kill, crash): drop the pool so the next
+    # verification starts a fresh one
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _items(chunk):
+    return [(d.get("prev_hash"), d.get("enc")) for d in chunk]
+
+
+def _iter_inline(chunks):
+    for chunk in chunks:
+        yield from zip(chunk, _expected_hashes(_items(chunk)))
+
+
+def _chunks(records, chunk_size: int):
+    while chunk := list(islice(records, chunk_size)):
+        yield chunk
+
+
+def iter_expected(records, chunk_size: int = AUDIT_VERIFY_CHUNK):
+    """
+    Yields (record, expected_hash) in input order.
+
+    Each record's expected hash depends only on its own stored prev_hash
+    and enc, so chunks are hashed in parallel; the caller does the cheap
+    linear linkage check on the merged stream. At most 2 chunks per
+    worker are in flight, so memory stays bounded. If the pool breaks,
+    the rest of the run is hashed inline.
+    """
+    chunks = _chunks(iter(records), chunk_size)
+
+    if AUDIT_VERIFY_WORKERS <= 1:
+        yield from _iter_inline(chunks)
+        return
+
+    pool = _get_pool()
+    pending = deque()
+    unsent = None
+
+    try:
+        while True:
+            try:
+                while len(pending) < AUDIT_VERIFY_WORKERS * 2:
+                    unsent = next(chunks, None)
+                    if unsent is None:
+                        break
+                    pending.append((unsent, pool.submit(_expected_hashes, _items(unsent))))
+                    unsent = None
+
+                if not pending:
+                    return
+
+                expected = pending[0][1].result()
+            except BrokenProcessPool:
+                _discard_pool(pool)
+                left = [chunk for chunk, _ in pending] + ([unsent] if unsent else [])
+                pending.clear()
+                yield from _iter_inline(left)
+                yield from _iter_inline(chunks)
+                return
+
+            chunk, _ = pending.popleft()
+            yield from zip(chunk, expected)
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+# ===============================
+# VERIFICATION
+# ===============================
+
+def verify_chain(records, prev_hash: str = "GENESIS", index: int = 0) -> dict:
+    """
+    Rehashes `records` (in seq order) on top of `prev_hash`.
+
+    `index` is the chain position of the first record, so errors report
+    the same absolute index whether verification starts at genesis or
+    resumes from a checkpoint.
+    """
+    head_seq = index
+
+    for d, expected_hash in iter_expected(records):
+        enc = d.get("enc")
+        stored_prev = d.get("prev_hash")
+        stored_hash = d.get("hash")
+
+        if not enc or not stored_prev or not stored_hash:
+            return {
+                "ok": False,
+                "error": "Missing fields",
+                "index": index,
+            }
+
+        if stored_prev != prev_hash:
+            return {
+                "ok": False,
+                "error": "Broken prev_hash",
+                "index": index,
+                "expected_prev": prev_hash,
+                "found_prev": stored_prev,
+            }
+
+        # stored_prev == prev_hash here, so the worker hashed the same input
+        if stored_hash != expected_hash:
+            return {
+                "ok": False,
+                "error": "Hash mismatch",
+                "index": index,
+                "expected_hash": expected_hash,
+                "found_hash": stored_hash,
+            }
+
+        prev_hash = stored_hash
+        head_seq = d.get("seq", head_seq + 1)
+        index += 1
+
+    return {
+        "ok": True,
+        "records_verified": index,
+        "root_hash": prev_hash,
+        "head_seq": head_seq,
+    }
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from app.db import audit_logs, audit_checkpoints
+from app.audit_signer import sign_root_hash, verify_root_signature
+
+
+def _signed_message(seq: int, log_hash: str) -> str:
+    # Binds the chain position into the signed root
+    return f"{seq}:{log_hash}"
+
+
+def save_checkpoint(seq: int, log_hash: str) -> dict:
+    signed = sign_root_hash(_signed_message(seq, log_hash))
+
+    checkpoint = {
+        "seq": seq,
+        "hash": log_hash,
+        "timestamp": signed["timestamp"],
+        "signature": signed["signature"],
+        "alg": signed["alg"],
+        "created_at": datetime.utcnow(),
+    }
+
+    audit_checkpoints.update_one(
+        {"seq": seq},
+        {"$setOnInsert": checkpoint},
+        upsert=True,
+    )
+    return checkpoint
+
+
+def is_valid_checkpoint(checkpoint: dict) -> bool:
+    if not verify_root_signature(
+        _signed_message(checkpoint["seq"], checkpoint["hash"]),
+        checkpoint["timestamp"],
+        checkpoint["signature"],
+    ):
+        return False
+
+    record = audit_logs.find_one(
+        {"seq": checkpoint["seq"]},
+        projection={"hash": 1},
+    )
+    return bool(record) and record.get("hash") == checkpoint["hash"]
+
+
+def latest_valid_checkpoint():
+    """
+    Newest checkpoint whose signature verifies and whose hash still
+    matches the record stored at its seq. Older checkpoints are tried
+    when a newer one fails, down to None (verify from genesis).
+    """
+    for checkpoint in audit_checkpoints.find().sort("seq", -1):
+        if is_valid_checkpoint(checkpoint):
+            return checkpoint
+    return None
@@ -1,11 +1,18 @@
 import json
 from datetime import datetime
-from app.crypto_utils import encrypt_log, sha256_hex, canonical_enc
-from app.db import audit_logs
+from app.crypto_utils import encrypt_log, encrypt_many, blind_index_fields
+from app.audit_chain import iter_expected
+from app.audit_writer import audit_writer
+from app.executor import run_cpu
+from app.metrics import STAGE_SECONDS
 
+# Encrypt + enqueue; the Mongo write itself runs on the writer thread
+_AUDIT_LOG = STAGE_SECONDS.labels("audit_log")
+_AUDIT_LOG_BATCH = STAGE_SECONDS.labels("audit_log_batch")
 
-def log_event(user_id, device_id, action, status, payload=None):
-    log_data = {
+
+def _log_data(user_id, device_id, action, status, payload=None):
+    return {
         "user_id": user_id,
         "device_id": device_id,
         "action": action,
@@ -14,31 +21,56 @@ def log_event(user_id, device_id, action, status, payload=None):
         "ts": datetime.utcnow().isoformat(),
     }
 
-    plaintext = json.dumps(log_data, separators=(",", ":"))
-    enc = encrypt_log(plaintext)
 
-    last = audit_logs.find_one(sort=[("created_at", -1)])
-    prev_hash = last["hash"] if last else "GENESIS"
+def _plaintext(log_data: dict) -> str:
+    return json.dumps(log_data, separators=(",", ":"))
+
 
-    hash_input = (prev_hash + canonical_enc(enc)).encode()
-    log_hash = sha256_hex(hash_input)
+def _build_record(user_id, device_id, action, status, payload=None):
+    log_data = _log_data(user_id, device_id, action, status, payload)
+    enc = encrypt_log(_plaintext(log_data))
 
-    audit_logs.insert_one({
-        "enc": enc,
-        "prev_hash": prev_hash,
-        "hash": log_hash,
-        "created_at": datetime.utcnow(),
-    })
+    return {"enc": enc, "bidx": blind_index_fields(log_data)}
+
+
+def _build_records(events) -> list:
+    log_data = [_log_data(*event) for event in events]
+    encs = encrypt_many([_plaintext(d) for d in log_data])
+
+    return [
+        {"enc": enc, "bidx": blind_index_fields(d)}
+        for d, enc in zip(log_data, encs)
+    ]
+
+
+def log_event(user_id, device_id, action, status, payload=None):
+    # Chaining and the Mongo write happen on the audit writer thread
+    with _AUDIT_LOG.time():
+        audit_writer.submit(
+            _build_record(user_id, device_id, action, status, payload)
+        )
+
+
+async def log_event_async(user_id, device_id, action, status, payload=None):
+    with _AUDIT_LOG.time():
+        await audit_writer.submit_async(
+            _build_record(user_id, device_id, action, status, payload)
+        )
+
+
+async def log_events_async(events):
+    # events: iterable of (user_id, device_id, action, status[, payload])
+    with _AUDIT_LOG_BATCH.time():
+        # Encrypting + blind-indexing a large batch would stall the loop
+        records = await run_cpu(_build_records, list(events))
+        await audit_writer.submit_many_async(records)
 
 
 def verify_audit_chain(logs):
     prev_hash = "GENESIS"
     checked = 0
 
-    for log in logs:
-        enc = log["enc"]
-        expected = sha256_hex((prev_hash + canonical_enc(enc)).encode())
-
+    for log, expected in iter_expected(logs):
         if log["prev_hash"] != prev_hash:
             return {
                 "valid": False,
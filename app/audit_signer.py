@@ -1,24 +1,50 @@
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives import serialization
 from datetime import datetime
 import base64
 import os
 
+from app.key_manager import load_cached_key, write_key_pair
+from app.algorithms import (
+    generate_private_key,
+    algorithm_for_key,
+    sign,
+    verify,
+    RS256,
+)
+
 SIGN_KEY_PATH = "keys/audit_signing_key.pem"
 VERIFY_KEY_PATH = "keys/audit_signing_pub.pem"
 
+# RS256 | ES256 | EdDSA for newly generated signing keys
+AUDIT_SIGNING_ALG = os.getenv("AUDIT_SIGNING_ALG", RS256)
+
+
+def generate_signing_keys():
+    os.makedirs(os.path.dirname(SIGN_KEY_PATH), exist_ok=True)
+
+    # ✅ Do NOT overwrite existing keys
+    if os.path.exists(SIGN_KEY_PATH) and os.path.exists(VERIFY_KEY_PATH):
+        return
+
+    write_key_pair(
+        generate_private_key(AUDIT_SIGNING_ALG),
+        SIGN_KEY_PATH,
+        VERIFY_KEY_PATH,
+    )
+
 
 def load_signing_key():
-    with open(SIGN_KEY_PATH, "rb") as f:
-        return serialization.load_pem_private_key(
-            f.read(),
-            password=None,
-        )
+    return load_cached_key(
+        SIGN_KEY_PATH,
+        lambda data: serialization.load_pem_private_key(data, password=None),
+    )
 
 
 def load_verify_key():
-    with open(VERIFY_KEY_PATH, "rb") as f:
-        return serialization.load_pem_public_key(f.read())
+    return load_cached_key(
+        VERIFY_KEY_PATH,
+        serialization.load_pem_public_key,
+    )
 
 
 def sign_root_hash(root_hash: str):
@@ -27,17 +53,13 @@ def sign_root_hash(root_hash: str):
 
     message = f"{root_hash}:{ts}".encode()
 
-    signature = key.sign(
-        message,
-        padding.PKCS1v15(),
-        hashes.SHA256(),
-    )
+    signature = sign(key, message)
 
     return {
         "root_hash": root_hash,
         "timestamp": ts,
         "signature": base64.b64encode(signature).decode(),
-        "alg": "RS256",
+        "alg": algorithm_for_key(key),
     }
 
 
@@ -48,12 +70,7 @@ def verify_root_signature(root_hash, timestamp, signature_b64):
     signature = base64.b64decode(signature_b64)
 
     try:
-        key.verify(
-            signature,
-            message,
-            padding.PKCS1v15(),
-            hashes.SHA256(),
-        )
+        verify(key, signature, message)
         return True
     except Exception:
         return False
@@ -0,0 +1,297 @@
+import os
+import asyncio
+import queue
+import threading
+import time
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+from app.crypto_utils import chain_hash
+from app.db import audit_logs, get_audit_head
+from app.audit_batches import AUDIT_MERKLE_BATCH_SIZE, batch_sealer
+from app.metrics import Gauge
+
+# ===============================
+# CONFIG
+# ===============================
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.05"))   # seconds
+AUDIT_RETRY_DELAY = 1.0
+
+_STOP = object()
+
+DUPLICATE_KEY = 11000
+
+
+class _HeadMoved(Exception):
+    """Another writer appended to the chain first; re-chain on its head."""
+
+
+def _describe(error: Exception) -> str:
+    # BulkWriteError's str() carries the failed documents; keep them out of logs
+    if isinstance(error, BulkWriteError):
+        errors = error.details.get("writeErrors") or [{}]
+        return f"{len(errors)} write error(s), first: {errors[0].get('errmsg', error)}"
+    return str(error)
+
+
+# ===============================
+# WRITER
+# ===============================
+
+class AuditWriter:
+    """
+    Single owner of the audit chain head.
+
+    Request handlers submit() encrypted records; a background thread
+    chains them in arrival order and flushes with insert_many once
+    AUDIT_BATCH_SIZE records are pending or AUDIT_FLUSH_INTERVAL elapsed.
+    A full queue blocks submit() (backpressure). stop() drains and
+    flushes everything that was accepted.
+
+    When the thread is not running (scripts, tests) submit() writes
+    synchronously through the same chaining code.
+    """
+
+    def __init__(self, collection, batch_size, flush_interval, queue_size):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        # (seq, hash) of the last record written, loaded lazily
+        self._head = None
+        self._head_lock = threading.Lock()
+        self._sealed_upto = 0
+        self._thread = None
+        self._stopping = threading.Event()
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="audit-writer",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        thread = self._thread
+        if not thread:
+            return
+
+        self._stopping.set()
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+
+        # Anything enqueued after the sentinel is written synchronously
+        leftovers = []
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not _STOP:
+                leftovers.append(record)
+
+        if leftovers:
+            self._flush(leftovers)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    # ---------- producer side ----------
+
+    def submit(self, record: dict):
+        if not self.running:
+            self._flush([record])
+            return
+
+        self._queue.put(record)
+
+    def submit_many(self, records: list):
+        if not self.running:
+            self._flush(list(records))
+            return
+
+        for record in records:
+            self._queue.put(record)
+
+    async def submit_many_async(self, records: list):
+        if not self.running:
+            await asyncio.to_thread(self._flush, list(records))
+            return
+
+        for i, record in enumerate(records):
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                await asyncio.to_thread(self.submit_many, records[i:])
+                return
+
+    async def submit_async(self, record: dict):
+        if not self.running:
+            await asyncio.to_thread(self._flush, [record])
+            return
+
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Backpressure without blocking the event loop
+            await asyncio.to_thread(self._queue.put, record)
+
+    # ---------- consumer side ----------
+
+    def _run(self):
+        batch = []
+        deadline = 0.0
+
+        while True:
+            if batch:
+                timeout = max(0.0, deadline - time.monotonic())
+            else:
+                timeout = self.flush_interval
+
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+
+            if record is _STOP:
+                break
+
+            if record is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(record)
+
+            if batch and (
+                len(batch) >= self.batch_size
+                or time.monotonic() >= deadline
+            ):
+                self._flush(batch)
+                batch = []
+
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch: list):
+        while batch:
+            try:
+                self._write(batch)
+                self._notify_sealer()
+                return
+            except _HeadMoved:
+                # Normal with several workers: retry at once on the new head
+                continue
+            except Exception as e:
+                if self._stopping.is_set():
+                    try:
+                        self._write(batch)
+                    except _HeadMoved:
+                        continue
+                    except Exception as final:
+                        print(f"Audit flush failed, dropping {len(batch)} records:", _describe(final))
+                    return
+
+                print("Audit flush failed, retrying:", _describe(e))
+                time.sleep(AUDIT_RETRY_DELAY)
+
+    def _notify_sealer(self):
+        # Wake the sealer when this flush completed a Merkle batch
+        seq = self._head[0] if self._head else 0
+        if seq // AUDIT_MERKLE_BATCH_SIZE != self._sealed_upto:
+            self._sealed_upto = seq // AUDIT_MERKLE_BATCH_SIZE
+            batch_sealer.notify()
+
+    def _drop_written(self, batch: list):
+        # A previous attempt may have committed before failing. Its
+        # records carry the hashes they were written under; the ordered
+        # insert means whatever landed is a prefix of the batch.
+        attempted = [r["_written_as"] for r in batch if "_written_as" in r]
+        if not attempted:
+            return
+
+        written = self.collection.count_documents({"hash": {"$in": attempted}})
+        del batch[:written]
+
+        for record in batch:
+            record.pop("_written_as", None)
+
+    def _write(self, batch: list):
+        with self._head_lock:
+            self._drop_written(batch)
+            if not batch:
+                return
+
+            if self._head is None:
+                self._head = get_audit_head()
+
+            seq, prev_hash = self._head
+            created_at = datetime.utcnow()
+            docs = []
+
+            for record in batch:
+                enc = record["enc"]
+                log_hash = chain_hash(prev_hash, enc)
+                seq += 1
+
+                doc = {
+                    "seq": seq,
+                    "enc": enc,
+                    "prev_hash": prev_hash,
+                    "hash": log_hash,
+                    "created_at": created_at,
+                }
+                if record.get("bidx"):
+                    doc["bidx"] = record["bidx"]
+
+                docs.append(doc)
+                prev_hash = log_hash
+
+            try:
+                self.collection.insert_many(docs, ordered=True)
+            except BulkWriteError as e:
+                # Keep the prefix that made it; retry only the rest on
+                # top of whatever head the collection now holds
+                del batch[:e.details.get("nInserted", 0)]
+                self._head = None
+
+                errors = e.details.get("writeErrors") or []
+                if errors and errors[0].get("code") == DUPLICATE_KEY:
+                    raise _HeadMoved() from None
+                raise
+            except Exception:
+                # Outcome unknown: remember what each record was written
+                # as, so the retry skips any that landed, then re-read
+                # the head before chaining the rest
+                for record, doc in zip(batch, docs):
+                    record["_written_as"] = doc["hash"]
+                self._head = None
+                raise
+
+            self._head = (seq, prev_hash)
+
+
+audit_writer = AuditWriter(
+    audit_logs,
+    batch_size=AUDIT_BATCH_SIZE,
+    flush_interval=AUDIT_FLUSH_INTERVAL,
+    queue_size=AUDIT_QUEUE_SIZE,
+)
+
+Gauge(
+    "gateway_audit_queue_depth",
+    "Audit events accepted but not yet written to Mongo.",
+    collect=lambda: {(): audit_writer._queue.qsize()},
+)
@@ -1,63 +1,87 @@
 # app/auth_utils.py
 
 import jwt
+import os
 import time
 import uuid
 import base64
+import hashlib
 
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives import serialization
 
-from app.key_manager import load_private_key, load_public_key
-from app.data_store import (
-    active_device_tokens,
-    revoked_tokens,
-    cleanup_expired_tokens,
-)
-
-ALGORITHM = "RS256"
+from app.key_manager import load_public_key
+from app.signing_engine import signing_engine
+from app.algorithms import algorithm_for_key, verify
+from app.lru_cache import LRUCache
+from app.executor import run_cpu
+from app.token_store import token_store
+from app.metrics import STAGE_SECONDS, REJECTIONS, track_cache
 
 TOKEN_LIFETIME_SECONDS = 600
 
+# Parsed device PoP keys, keyed by SHA-256 of the PEM carried in cnf.pk
+POP_KEY_CACHE_SIZE = int(os.getenv("POP_KEY_CACHE_SIZE", "10000"))
+POP_KEY_CACHE_TTL = int(os.getenv("POP_KEY_CACHE_TTL", str(TOKEN_LIFETIME_SECONDS)))
 
-# ====================================================
-# TOKEN GENERATION (WITH AUTOMATIC DEVICE ROTATION)
-# ====================================================
+pop_key_cache = LRUCache(POP_KEY_CACHE_SIZE, ttl=POP_KEY_CACHE_TTL)
 
-def generate_token(user_id: str, device_id: str, client_public_key: str):
+# SHA-256(token) -> (verifying key, payload), each entry valid until exp
+VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv("VERIFIED_TOKEN_CACHE_SIZE", "50000"))
 
-    cleanup_expired_tokens()
+verified_token_cache = LRUCache(VERIFIED_TOKEN_CACHE_SIZE)
 
-    now = int(time.time())
-    exp = now + TOKEN_LIFETIME_SECONDS
-    jti = str(uuid.uuid4())
+track_cache("pop_key", pop_key_cache)
+track_cache("verified_token", verified_token_cache)
 
-    device_key = f"{user_id}:{device_id}"
+_JWT_SIGN = STAGE_SECONDS.labels("jwt_sign")
+_JWT_VERIFY = STAGE_SECONDS.labels("jwt_verify")
+_POP_VERIFY = STAGE_SECONDS.labels("pop_verify")
 
-    # 🔁 Revoke old token if device already has one
-    if device_key in active_device_tokens:
-        old_jti = active_device_tokens[device_key]["jti"]
-        revoked_tokens.add(old_jti)
 
-    payload = {
+# ====================================================
+# TOKEN GENERATION (WITH AUTOMATIC DEVICE ROTATION)
+# ====================================================
+
+def _token_claims(user_id: str, device_id: str, client_public_key: str) -> dict:
+    now = int(time.time())
+
+    return {
         "sub": user_id,
         "device_id": device_id,
         "iat": now,
-        "exp": exp,
-        "jti": jti,
+        "exp": now + TOKEN_LIFETIME_SECONDS,
+        "jti": str(uuid.uuid4()),
         "cnf": {
             "pk": client_public_key
         }
     }
 
-    private_key = load_private_key()
-    token = jwt.encode(payload, private_key, algorithm=ALGORITHM)
 
-    # Store active token for this device
-    active_device_tokens[device_key] = {
-        "jti": jti,
-        "exp": exp
-    }
+def generate_token(user_id: str, device_id: str, client_public_key: str):
+
+    token_store.cleanup()
+
+    payload = _token_claims(user_id, device_id, client_public_key)
+
+    with _JWT_SIGN.time():
+        token = signing_engine.sign(payload)
+
+    # Store active token for this device (revokes the previous one)
+    token_store.activate(f"{user_id}:{device_id}", payload["jti"], payload["exp"])
+
+    return token
+
+
+async def generate_token_async(user_id: str, device_id: str, client_public_key: str):
+    """generate_token for async handlers; signing is bounded by the engine."""
+    token_store.cleanup()
+
+    payload = _token_claims(user_id, device_id, client_public_key)
+
+    with _JWT_SIGN.time():
+        token = await signing_engine.sign_async(payload)
+
+    await token_store.activate_async(f"{user_id}:{device_id}", payload["jti"], payload["exp"])
 
     return token
 
@@ -66,57 +90,153 @@ def generate_token(user_id: str, device_id: str, client_public_key: str):
 # VERIFY JWT
 # ====================================================
 
+def _cached_payload(token: str):
+    # Skip the signature check for a token already verified with this key;
+    # a reloaded key is a new object, so old entries stop matching
+    cached = verified_token_cache.get(hashlib.sha256(token.encode()).digest())
+    if cached is not None and cached[0] is load_public_key():
+        return cached[1]
+    return None
+
+
+def _decode_token(token: str) -> dict:
+    payload = _cached_payload(token)
+    if payload is not None:
+        return payload
+
+    public_key = load_public_key()
+
+    # Only the algorithm of the configured key is accepted
+    payload = jwt.decode(
+        token,
+        public_key,
+        algorithms=[algorithm_for_key(public_key)],
+    )
+
+    verified_token_cache.set(
+        hashlib.sha256(token.encode()).digest(),
+        (public_key, payload),
+        expires_at=payload["exp"],
+    )
+    return payload
+
+
 def verify_jwt(token: str):
+    with _JWT_VERIFY.time():
+        reason = _check_jwt(token)
+
+    if isinstance(reason, str):
+        REJECTIONS.labels(reason).inc()
+        return None
+
+    return reason
+
+
+async def verify_jwt_async(token: str):
+    """verify_jwt for async handlers: only jwt.decode leaves the event loop."""
+    with _JWT_VERIFY.time():
+        reason = await _check_jwt_async(token)
+
+    if isinstance(reason, str):
+        REJECTIONS.labels(reason).inc()
+        return None
+
+    return reason
+
+
+def _check_active(payload: dict, active):
+    # ❌ Reject if no active token for device
+    if active is None:
+        return "token_not_active"
+
+    # ❌ Reject if token is not the current active one
+    if active["jti"] != payload.get("jti"):
+        return "token_superseded"
+
+    return payload
+
+
+def _device_key(payload: dict) -> str:
+    return f"{payload['sub']}:{payload['device_id']}"
+
+
+def _check_jwt(token: str):
+    """Returns the payload, or the rejection reason as a string."""
     try:
-        cleanup_expired_tokens()
+        token_store.cleanup()
 
-        public_key = load_public_key()
-        payload = jwt.decode(token, public_key, algorithms=[ALGORITHM])
+        payload = _decode_token(token)
 
-        jti = payload.get("jti")
-        device_key = f"{payload['sub']}:{payload['device_id']}"
+        # Revocation / active-token checks run on cache hits too
 
         # ❌ Reject revoked tokens
-        if jti in revoked_tokens:
-            return None
+        if token_store.is_revoked(payload.get("jti")):
+            return "token_revoked"
 
-        # ❌ Reject if no active token for device
-        if device_key not in active_device_tokens:
-            return None
+        return _check_active(payload, token_store.get_active(_device_key(payload)))
 
-        # ❌ Reject if token is not the current active one
-        if active_device_tokens[device_key]["jti"] != jti:
-            return None
+    except jwt.ExpiredSignatureError:
+        return "token_expired"
+    except jwt.InvalidTokenError:
+        return "token_invalid"
 
-        return payload
+
+async def _check_jwt_async(token: str):
+    try:
+        token_store.cleanup()
+
+        payload = _cached_payload(token)
+        if payload is None:
+            payload = await run_cpu(_decode_token, token)
+
+        # Token-store checks stay on the loop (redis.asyncio)
+        if await token_store.is_revoked_async(payload.get("jti")):
+            return "token_revoked"
+
+        return _check_active(payload, await token_store.get_active_async(_device_key(payload)))
 
     except jwt.ExpiredSignatureError:
-        return None
+        return "token_expired"
     except jwt.InvalidTokenError:
-        return None
+        return "token_invalid"
 
 
 # ====================================================
 # VERIFY POP SIGNATURE
 # ====================================================
 
+def load_pop_public_key(public_key_pem: str):
+    pem = public_key_pem.encode()
+    cache_key = hashlib.sha256(pem).digest()
+
+    public_key = pop_key_cache.get(cache_key)
+    if public_key is None:
+        public_key = serialization.load_pem_public_key(pem)
+        pop_key_cache.set(cache_key, public_key)
+
+    return public_key
+
+
 def verify_pop_signature(message: bytes, signature_b64, public_key_pem: str) -> bool:
+    with _POP_VERIFY.time():
+        ok = _check_pop_signature(message, signature_b64, public_key_pem)
+
+    if not ok:
+        REJECTIONS.labels("bad_pop_signature").inc()
+    return ok
+
+
+def _check_pop_signature(message: bytes, signature_b64, public_key_pem: str) -> bool:
     try:
-        public_key = serialization.load_pem_public_key(
-            public_key_pem.encode()
-        )
+        public_key = load_pop_public_key(public_key_pem)
 
         if isinstance(signature_b64, str):
             signature = base64.b64decode(signature_b64.encode())
         else:
             signature = base64.b64decode(signature_b64)
 
-        public_key.verify(
-            signature,
-            message,
-            padding.PKCS1v15(),
-            hashes.SHA256(),
-        )
+        # RSA PKCS#1 v1.5, ECDSA P-256 or Ed25519, per the device key
+        verify(public_key, signature, message)
 
         return True
 
@@ -1,9 +1,26 @@
 import os
+import hmac
 import json
 import base64
 import hashlib
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
+# Records per task when encrypt_many / decrypt_many get an executor
+AEAD_CHUNK = 256
+
+# Audit record formats:
+#   1 (legacy) {"v", "nonce", "ciphertext"} as base64 strings, chain hash
+#     over the canonical JSON of enc
+#   2          {"fmt": 2, "v", "nonce", "ct"} with raw bytes (BSON binary),
+#     chain hash over a fixed binary layout (see chain_hash)
+RECORD_FORMAT_LEGACY = 1
+RECORD_FORMAT_BINARY = 2
+
+AUDIT_RECORD_FORMAT = int(os.getenv("AUDIT_RECORD_FORMAT", str(RECORD_FORMAT_BINARY)))
+
+if AUDIT_RECORD_FORMAT not in (RECORD_FORMAT_LEGACY, RECORD_FORMAT_BINARY):
+    raise RuntimeError("AUDIT_RECORD_FORMAT must be 1 or 2")
+
 def _load_keyring():
     raw = os.environ.get("AES_LOG_KEYS")
     if not raw:
@@ -46,17 +63,67 @@ ACTIVE_VERSION = os.environ.get("AES_LOG_ACTIVE")
 if ACTIVE_VERSION not in KEYRING:
     raise RuntimeError("AES_LOG_ACTIVE must exist in AES_LOG_KEYS")
 
+# One cipher context per key version, built once (AESGCM is stateless
+# and safe to share across threads)
+CIPHERS = {version: AESGCM(key) for version, key in KEYRING.items()}
+
+# Keyed HMAC "blind index" over searchable audit fields. Separate from the
+# AES keyring so search tokens never reveal anything about log keys.
+BLIND_INDEX_FIELDS = ("user_id", "device_id", "action", "status")
+
+
+def _load_blind_index_key():
+    raw = os.environ.get("AUDIT_BLIND_INDEX_KEY")
+    if not raw:
+        return None
+
+    try:
+        key = base64.b64decode(raw, validate=True)
+    except Exception as e:
+        raise RuntimeError("Invalid base64 for AUDIT_BLIND_INDEX_KEY") from e
+
+    if len(key) < 32:
+        raise RuntimeError(
+            f"AUDIT_BLIND_INDEX_KEY must be at least 32 bytes, got {len(key)}"
+        )
+
+    return key
+
+BLIND_INDEX_KEY = _load_blind_index_key()
+
+def blind_index(field: str, value) -> str:
+    if BLIND_INDEX_KEY is None:
+        raise RuntimeError("AUDIT_BLIND_INDEX_KEY not set")
+
+    message = f"{field}\x00{value}".encode()
+    return hmac.new(BLIND_INDEX_KEY, message, hashlib.sha256).hexdigest()[:32]
+
+def blind_index_fields(log_data: dict):
+    if BLIND_INDEX_KEY is None:
+        return None
+
+    return {
+        field: blind_index(field, log_data.get(field))
+        for field in BLIND_INDEX_FIELDS
+    }
+
 def encrypt_log(plaintext: str) -> dict:
-    key = KEYRING[ACTIVE_VERSION]
-    aesgcm = AESGCM(key)
     nonce = os.urandom(12)
 
-    ciphertext = aesgcm.encrypt(
+    ciphertext = CIPHERS[ACTIVE_VERSION].encrypt(
         nonce,
         plaintext.encode(),
         None
     )
 
+    if AUDIT_RECORD_FORMAT == RECORD_FORMAT_BINARY:
+        return {
+            "fmt": RECORD_FORMAT_BINARY,
+            "v": ACTIVE_VERSION,
+            "nonce": nonce,
+            "ct": ciphertext,
+        }
+
     return {
         "v": ACTIVE_VERSION,
         "nonce": base64.b64encode(nonce).decode(),
@@ -65,16 +132,61 @@ def encrypt_log(plaintext: str) -> dict:
 
 def decrypt_log(enc: dict) -> str:
     version = enc["v"]
-    key = KEYRING.get(version)
-    if not key:
+    aesgcm = CIPHERS.get(version)
+    if not aesgcm:
         raise RuntimeError(f"Unknown key version {version}")
 
-    aesgcm = AESGCM(key)
-    nonce = base64.b64decode(enc["nonce"])
-    ciphertext = base64.b64decode(enc["ciphertext"])
+    fmt = enc.get("fmt", RECORD_FORMAT_LEGACY)
+
+    if fmt == RECORD_FORMAT_BINARY:
+        nonce = bytes(enc["nonce"])
+        ciphertext = bytes(enc["ct"])
+    elif fmt == RECORD_FORMAT_LEGACY:
+        nonce = base64.b64decode(enc["nonce"])
+        ciphertext = base64.b64decode(enc["ciphertext"])
+    else:
+        raise RuntimeError(f"Unknown audit record format {fmt}")
 
     return aesgcm.decrypt(nonce, ciphertext, None).decode()
 
+def _encrypt_chunk(plaintexts: list) -> list:
+    return [encrypt_log(p) for p in plaintexts]
+
+def _decrypt_chunk(encs: list) -> list:
+    results = []
+
+    for enc in encs:
+        try:
+            results.append(decrypt_log(enc))
+        except Exception as e:
+            results.append(e)
+
+    return results
+
+def _map_chunks(fn, items: list, executor, chunk_size: int) -> list:
+    if executor is None or len(items) <= chunk_size:
+        return fn(items)
+
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    # OpenSSL releases the GIL, so chunks run in parallel
+    results = []
+    for part in executor.map(fn, chunks):
+        results.extend(part)
+    return results
+
+def encrypt_many(plaintexts: list, executor=None, chunk_size: int = AEAD_CHUNK) -> list:
+    """encrypt_log over a list, optionally spread over `executor`."""
+    return _map_chunks(_encrypt_chunk, plaintexts, executor, chunk_size)
+
+def decrypt_many(encs: list, executor=None, chunk_size: int = AEAD_CHUNK) -> list:
+    """
+    decrypt_log over a list, optionally spread over `executor`. Returns
+    one entry per record: the plaintext, or the exception that record
+    raised, so one bad record does not abort the rest.
+    """
+    return _map_chunks(_decrypt_chunk, encs, executor, chunk_size)
+
 def canonical_enc(enc: dict) -> str:
     return json.dumps(enc, sort_keys=True, separators=(",", ":"))
 
@@ -82,3 +194,35 @@ def sha256_hex(data) -> str:
     if isinstance(data, str):
         data = data.encode()
     return hashlib.sha256(data).hexdigest()
+
+def chain_hash(prev_hash: str, enc: dict) -> str:
+    """
+    Hash linking a record to its predecessor, for either record format.
+
+    Format 2 hashes, in order:
+      0x02 | len(v) u8 | v | len(prev_hash) u8 | prev_hash | nonce (12) | ct
+    prev_hash is the predecessor's hex hash, or "GENESIS", as ASCII.
+    """
+    fmt = enc.get("fmt", RECORD_FORMAT_LEGACY)
+
+    if fmt == RECORD_FORMAT_LEGACY:
+        return sha256_hex((prev_hash + canonical_enc(enc)).encode())
+
+    if fmt != RECORD_FORMAT_BINARY:
+        raise ValueError(f"Unknown audit record format {fmt}")
+
+    version = str(enc["v"]).encode()
+    prev = prev_hash.encode()
+    nonce = bytes(enc["nonce"])
+
+    if len(version) > 255 or len(prev) > 255 or len(nonce) != 12:
+        raise ValueError("Malformed audit record")
+
+    h = hashlib.sha256()
+    h.update(bytes((RECORD_FORMAT_BINARY, len(version))))
+    h.update(version)
+    h.update(bytes((len(prev),)))
+    h.update(prev)
+    h.update(nonce)
+    h.update(enc["ct"])
+    return h.hexdigest()
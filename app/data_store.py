@@ -1,4 +1,6 @@
 # app/data_store.py
+import heapq
+import threading
 import time
 
 # -----------------------------
@@ -9,25 +11,142 @@ import time
 # device_key = f"{user_id}:{device_id}"
 active_device_tokens = {}
 
+# -----------------------------
+# Revocation list
+# -----------------------------
+class RevocationList:
+    """
+    Revoked JTIs with their token exp. Once exp has passed the JWT
+    signature check rejects the token on its own, so the entry is
+    dropped instead of being kept forever.
+    """
+
+    def __init__(self):
+        # jti -> exp
+        self._entries: dict[str, int] = {}
+        self._heap: list[tuple[int, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, jti: str, exp: int):
+        if exp <= int(time.time()):
+            return  # already unusable
+
+        with self._lock:
+            self._entries[jti] = exp
+            heapq.heappush(self._heap, (exp, jti))
+
+    def prune(self):
+        now = int(time.time())
+
+        # Unlocked peek; a concurrent prune may empty the heap under us
+        try:
+            if self._heap[0][0] > now:
+                return
+        except IndexError:
+            return
+
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                exp, jti = heapq.heappop(self._heap)
+                if self._entries.get(jti) == exp:
+                    del self._entries[jti]
+
+    def __contains__(self, jti) -> bool:
+        exp = self._entries.get(jti)
+        return exp is not None and exp > int(time.time())
+
+    def __len__(self):
+        return len(self._entries)
+
+
 # revoked JTIs
-revoked_tokens = set()
+revoked_tokens = RevocationList()
 
 # Optional replay guard (if you use it elsewhere)
 used_jtis = set()
 used_signatures = set()
 
+# (exp, device_key, jti) min-heap next to active_device_tokens.
+# Entries replaced by a rotation are left in place and skipped when
+# popped (lazy deletion).
+_expiry_heap: list[tuple[int, str, str]] = []
+_lock = threading.Lock()
+
+TOKEN_CLEANUP_INTERVAL = 5   # seconds
+
+# -----------------------------
+# Active token registration
+# -----------------------------
+def set_active_token(device_key: str, jti: str, exp: int):
+    with _lock:
+        active_device_tokens[device_key] = {
+            "jti": jti,
+            "exp": exp,
+        }
+        heapq.heappush(_expiry_heap, (exp, device_key, jti))
+
+def activate_token(device_key: str, jti: str, exp: int):
+    # 🔁 Revoke old token if device already has one
+    old = active_device_tokens.get(device_key)
+    if old:
+        revoked_tokens.add(old["jti"], old["exp"])
+
+    set_active_token(device_key, jti, exp)
+
 # -----------------------------
 # Cleanup expired tokens
 # -----------------------------
 def cleanup_expired_tokens():
+    # O(number of expired entries); O(1) when nothing is due
+    revoked_tokens.prune()
+
     now = int(time.time())
-    expired_devices = []
 
-    for device_key, token_data in active_device_tokens.items():
-        if token_data["exp"] <= now:
-            expired_devices.append(device_key)
+    # Unlocked peek for the common nothing-due case; another thread may
+    # empty the heap between the check and the index
+    try:
+        if _expiry_heap[0][0] > now:
+            return
+    except IndexError:
+        return
+
+    with _lock:
+        while _expiry_heap and _expiry_heap[0][0] <= now:
+            _, device_key, jti = heapq.heappop(_expiry_heap)
+
+            current = active_device_tokens.get(device_key)
+            if current is None or current["jti"] != jti:
+                continue  # stale: device rotated since
+
+            del active_device_tokens[device_key]
+
+# -----------------------------
+# Background cleanup
+# -----------------------------
+_ticker = None
+_ticker_stop = threading.Event()
+
+def _cleanup_loop(interval: float):
+    while not _ticker_stop.wait(interval):
+        cleanup_expired_tokens()
+
+def start_cleanup_ticker(interval: float = TOKEN_CLEANUP_INTERVAL):
+    global _ticker
+    if _ticker and _ticker.is_alive():
+        return
+
+    _ticker_stop.clear()
+    _ticker = threading.Thread(
+        target=_cleanup_loop,
+        args=(interval,),
+        name="token-cleanup",
+        daemon=True,
+    )
+    _ticker.start()
 
-    for device_key in expired_devices:
-        old_jti = active_device_tokens[device_key]["jti"]
-        revoked_tokens.add(old_jti)
-        del active_device_tokens[device_key]
\ No newline at end of file
+def stop_cleanup_ticker():
+    global _ticker
+    _ticker_stop.set()
+    if _ticker:
+        _ticker.join()
+        _ticker = None
@@ -1,26 +1,102 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient, ASCENDING, DESCENDING, UpdateOne
 import os
 
 client = MongoClient(os.environ["MONGODB_URI"])
 db = client[os.environ["MONGO_DB"]]
 audit_logs = db[os.environ["MONGO_COLLECTION"]]
 
+# Used by async request handlers
+async_client = AsyncMongoClient(os.environ["MONGODB_URI"])
+async_db = async_client[os.environ["MONGO_DB"]]
+async_audit_logs = async_db[os.environ["MONGO_COLLECTION"]]
+audit_checkpoints = db[
+    os.getenv("MONGO_CHECKPOINT_COLLECTION", f"{os.environ['MONGO_COLLECTION']}_checkpoints")
+]
+audit_batches = db[
+    os.getenv("MONGO_BATCH_COLLECTION", f"{os.environ['MONGO_COLLECTION']}_batches")
+]
+devices = db[os.getenv("MONGO_DEVICE_COLLECTION", "devices")]
+
+
+def ensure_indexes():
+    backfill_audit_seq()
+
+    audit_logs.create_index([("seq", ASCENDING)], unique=True, name="seq_unique")
+    audit_logs.create_index([("hash", ASCENDING)], unique=True, name="hash_unique")
+
+    # Blind-index lookups, newest first
+    audit_logs.create_index([("bidx.user_id", ASCENDING), ("seq", DESCENDING)], name="bidx_user_seq")
+    audit_logs.create_index([("bidx.device_id", ASCENDING), ("seq", DESCENDING)], name="bidx_device_seq")
+    audit_logs.create_index(
+        [("bidx.action", ASCENDING), ("bidx.status", ASCENDING), ("seq", DESCENDING)],
+        name="bidx_action_status_seq",
+    )
+    # Status-only filters can't use the action-led index above
+    audit_logs.create_index([("bidx.status", ASCENDING), ("seq", DESCENDING)], name="bidx_status_seq")
+
+    audit_checkpoints.create_index([("seq", ASCENDING)], unique=True, name="seq_unique")
+    audit_batches.create_index([("batch", ASCENDING)], unique=True, name="batch_unique")
+
+    devices.create_index(
+        [("user_id", ASCENDING), ("device_id", ASCENDING)],
+        unique=True,
+        name="user_device_unique",
+    )
+
+
+def backfill_audit_seq(batch_size: int = 1000):
+    # One-time migration: number legacy records in their created_at order.
+    # Resumable: an interrupted run left a numbered prefix, so continue
+    # after the highest seq until no record is missing one.
+    if not audit_logs.find_one({"seq": {"$exists": False}}, projection={"_id": 1}):
+        return
+
+    seq, _ = get_audit_head()
+    ops = []
+
+    # created_at is not indexed; let the sort spill to disk on large logs
+    cursor = audit_logs.find(
+        {"seq": {"$exists": False}},
+        projection={"_id": 1},
+        sort=[("created_at", ASCENDING), ("_id", ASCENDING)],
+        allow_disk_use=True,
+    )
+
+    for doc in cursor:
+        seq += 1
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"seq": seq}}))
+
+        if len(ops) >= batch_size:
+            # Ordered, so whatever lands before a crash stays a prefix
+            audit_logs.bulk_write(ops, ordered=True)
+            ops = []
+
+    if ops:
+        audit_logs.bulk_write(ops, ordered=True)
+
 
 def insert_audit_log(doc: dict):
     audit_logs.insert_one(doc)
 
 
-def get_last_audit_hash() -> str:
+def get_audit_head() -> tuple[int, str]:
     doc = audit_logs.find_one(
-        {"hash": {"$exists": True}},
-        sort=[("created_at", -1)],
-        projection={"hash": 1},
+        {},
+        sort=[("seq", DESCENDING)],
+        projection={"seq": 1, "hash": 1},
     )
-    return doc["hash"] if doc else "GENESIS"
+    if not doc:
+        return 0, "GENESIS"
+    return doc["seq"], doc["hash"]
 
 
-def iter_audit_logs():
-    return audit_logs.find(
-        {"hash": {"$exists": True}},
-        sort=[("created_at", 1)],
-    )
+def get_last_audit_hash() -> str:
+    return get_audit_head()[1]
+
+
+def iter_audit_logs(start_seq: int = 1, end_seq: int | None = None):
+    query = {"seq": {"$gte": start_seq}}
+    if end_seq is not None:
+        query["seq"]["$lte"] = end_seq
+
+    return audit_logs.find(query, sort=[("seq", ASCENDING)])
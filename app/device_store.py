@@ -1,23 +1,124 @@
+import os
 from datetime import datetime
+
+from pymongo import UpdateOne
+
 from app.db import devices
+from app.lru_cache import LRUCache
+from app.metrics import track_cache
+
+# ===============================
+# CONFIG
+# ===============================
+
+DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", "100000"))
+# Other workers see a re-registered key after at most this many seconds
+DEVICE_CACHE_TTL = float(os.getenv("DEVICE_CACHE_TTL", "30"))
+
+# "user_id:device_id" -> public key PEM (registered devices only)
+device_cache = LRUCache(DEVICE_CACHE_SIZE, ttl=DEVICE_CACHE_TTL)
+
+track_cache("device", device_cache)
+
+
+def _cache_key(user_id: str, device_id: str) -> str:
+    return f"{user_id}:{device_id}"
+
+
+def _update(public_key: str, now: datetime) -> dict:
+    return {
+        "$set": {
+            "public_key": public_key,
+            "updated_at": now,
+        },
+        "$setOnInsert": {
+            "created_at": now,
+        },
+    }
+
+# ===============================
+# WRITES
+# ===============================
 
 def register_device(user_id: str, device_id: str, public_key: str):
+    now = datetime.utcnow()
     devices.update_one(
         {"user_id": user_id, "device_id": device_id},
-        {
-            "$set": {
-                "public_key": public_key,
-                "updated_at": datetime.utcnow(),
-            },
-            "$setOnInsert": {
-                "created_at": datetime.utcnow(),
-            },
-        },
+        _update(public_key, now),
         upsert=True,
     )
+    device_cache.set(_cache_key(user_id, device_id), public_key)
+
+def register_devices(items: list[tuple[str, str, str]]) -> int:
+    """Unordered bulk upsert of (user_id, device_id, public_key)."""
+    if not items:
+        return 0
+
+    now = datetime.utcnow()
+    devices.bulk_write(
+        [
+            UpdateOne(
+                {"user_id": user_id, "device_id": device_id},
+                _update(public_key, now),
+                upsert=True,
+            )
+            for user_id, device_id, public_key in items
+        ],
+        ordered=False,
+    )
+
+    for user_id, device_id, public_key in items:
+        device_cache.set(_cache_key(user_id, device_id), public_key)
+
+    return len(items)
+
+# ===============================
+# READS
+# ===============================
 
 def get_device(user_id: str, device_id: str):
     return devices.find_one(
         {"user_id": user_id, "device_id": device_id},
         {"_id": 0},
     )
+
+def peek_device_key(user_id: str, device_id: str):
+    # Cache only; never touches Mongo
+    return device_cache.get(_cache_key(user_id, device_id))
+
+def get_device_key(user_id: str, device_id: str):
+    public_key = peek_device_key(user_id, device_id)
+    if public_key is not None:
+        return public_key
+
+    doc = devices.find_one(
+        {"user_id": user_id, "device_id": device_id},
+        {"_id": 0, "public_key": 1},
+    )
+    if not doc:
+        return None
+
+    device_cache.set(_cache_key(user_id, device_id), doc["public_key"])
+    return doc["public_key"]
+
+def get_device_keys(pairs: list[tuple[str, str]]) -> list:
+    """Read-through lookup for many devices: one query for all misses."""
+    keys = [peek_device_key(user_id, device_id) for user_id, device_id in pairs]
+    misses = [pair for pair, key in zip(pairs, keys) if key is None]
+
+    if misses:
+        found = {}
+        cursor = devices.find(
+            {"$or": [{"user_id": u, "device_id": d} for u, d in set(misses)]},
+            {"_id": 0, "user_id": 1, "device_id": 1, "public_key": 1},
+        )
+        for doc in cursor:
+            found[(doc["user_id"], doc["device_id"])] = doc["public_key"]
+            device_cache.set(_cache_key(doc["user_id"], doc["device_id"]), doc["public_key"])
+
+        keys = [key if key is not None else found.get(pair) for pair, key in zip(pairs, keys)]
+
+    return keys
+
+def has_user(user_id: str) -> bool:
+    return devices.find_one({"user_id": user_id}, {"_id": 1}) is not None
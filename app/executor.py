@@ -0,0 +1,37 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# ===============================
+# CONFIG
+# ===============================
+
+# RSA / AES work from async handlers. OpenSSL releases the GIL, so a
+# pool sized to the core count keeps the event loop free.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+
+cpu_executor = ThreadPoolExecutor(
+    max_workers=CPU_WORKERS,
+    thread_name_prefix="cpu",
+)
+
+# ===============================
+# HELPERS
+# ===============================
+
+async def run_cpu(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        cpu_executor,
+        functools.partial(fn, *args, **kwargs),
+    )
+
+
+async def run_io(fn, *args, **kwargs):
+    # Blocking client calls that have no async counterpart
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+def shutdown_executors():
+    cpu_executor.shutdown(wait=True)
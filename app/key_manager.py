@@ -1,8 +1,10 @@
 # app/key_manager.py
 import os
-from cryptography.hazmat.primitives.asymmetric import rsa
+from threading import Lock
 from cryptography.hazmat.primitives import serialization
 
+from app.algorithms import generate_private_key, RS256
+
 KEYS_DIR = "keys"
 
 PRIVATE_KEY_PATH = os.path.join(KEYS_DIR, "rsa_private.pem")
@@ -10,21 +12,56 @@ PUBLIC_KEY_PATH = os.path.join(KEYS_DIR, "rsa_public.pem")
 AES_KEY_PATH = os.path.join(KEYS_DIR, "aes_key.bin")
 
 
-# ---------------- RSA KEYS ----------------
+# ---------------- KEY CACHE ----------------
 
-def generate_rsa_keys():
-    os.makedirs(KEYS_DIR, exist_ok=True)
+# path -> (file stamp, parsed key)
+_key_cache: dict[str, tuple] = {}
+_key_cache_lock = Lock()
 
-    # ✅ Do NOT overwrite existing keys
-    if os.path.exists(PRIVATE_KEY_PATH) and os.path.exists(PUBLIC_KEY_PATH):
-        return
 
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048
-    )
+def _file_stamp(path: str):
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def load_cached_key(path: str, parse):
+    """
+    Returns the parsed key for `path`, re-reading the file only when its
+    inode / mtime / size changed since the last load.
+    """
+    stamp = _file_stamp(path)
+
+    cached = _key_cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    with _key_cache_lock:
+        cached = _key_cache.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        with open(path, "rb") as f:
+            key = parse(f.read())
+
+        _key_cache[path] = (stamp, key)
+        return key
+
+
+def reload_keys():
+    # Forces the next load_* call to re-read every key from disk
+    with _key_cache_lock:
+        _key_cache.clear()
+
 
-    with open(PRIVATE_KEY_PATH, "wb") as f:
+# ---------------- JWT KEYS ----------------
+
+# RS256 | ES256 | EdDSA; only used when generating a new key pair.
+# Existing keys keep whatever type they were created with.
+JWT_KEY_ALG = os.getenv("JWT_KEY_ALG", RS256)
+
+
+def write_key_pair(private_key, private_path: str, public_path: str):
+    with open(private_path, "wb") as f:
         f.write(
             private_key.private_bytes(
                 encoding=serialization.Encoding.PEM,
@@ -33,7 +70,7 @@ def generate_rsa_keys():
             )
         )
 
-    with open(PUBLIC_KEY_PATH, "wb") as f:
+    with open(public_path, "wb") as f:
         f.write(
             private_key.public_key().public_bytes(
                 encoding=serialization.Encoding.PEM,
@@ -42,17 +79,32 @@ def generate_rsa_keys():
         )
 
 
+def generate_jwt_keys():
+    os.makedirs(KEYS_DIR, exist_ok=True)
+
+    # ✅ Do NOT overwrite existing keys
+    if os.path.exists(PRIVATE_KEY_PATH) and os.path.exists(PUBLIC_KEY_PATH):
+        return
+
+    write_key_pair(
+        generate_private_key(JWT_KEY_ALG),
+        PRIVATE_KEY_PATH,
+        PUBLIC_KEY_PATH,
+    )
+
+
 def load_private_key():
-    with open(PRIVATE_KEY_PATH, "rb") as f:
-        return serialization.load_pem_private_key(
-            f.read(),
-            password=None
-        )
+    return load_cached_key(
+        PRIVATE_KEY_PATH,
+        lambda data: serialization.load_pem_private_key(data, password=None),
+    )
 
 
 def load_public_key():
-    with open(PUBLIC_KEY_PATH, "rb") as f:
-        return serialization.load_pem_public_key(f.read())
+    return load_cached_key(
+        PUBLIC_KEY_PATH,
+        serialization.load_pem_public_key,
+    )
 
 
 # ---------------- AES KEY ----------------
@@ -1,56 +1,106 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import os
+import asyncio
+
 from fastapi import FastAPI, Depends, Header, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
-from app.rate_limit import limiter
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from app.rate_limit import (
+    RateLimitExceeded,
+    RateLimitMiddleware,
+    too_many_requests,
+    enforce,
+    enforce_items,
+    max_batch_items,
+    limit_by_ip,
+    device_identity,
+)
 
 from app.replay_guard import (
-    check_and_mark_jti,
-    check_and_mark_signature,
+    check_and_mark_async,
+    REPLAY_JTI,
 )
 
 from app.auth_utils import (
-    generate_token,
-    verify_jwt,
+    generate_token_async,
+    verify_jwt_async,
     verify_pop_signature,
 )
 
-from app.key_manager import generate_rsa_keys
-from app.audit_logger import log_event
+from app.key_manager import generate_jwt_keys
+from app.audit_signer import generate_signing_keys
+from app.audit_logger import log_event_async, log_events_async
+from app.executor import run_cpu, run_io, shutdown_executors
+from app.redis_client import async_redis_client
+from app.db import async_client as async_mongo_client
+from app.audit_writer import audit_writer
+from app.audit_batches import batch_sealer
+from app.db import ensure_indexes
+from app.audit_chain import shutdown_verify_pool
+from app.token_store import token_store
+from app import device_store
+from app.signing_engine import signing_engine, SigningBusyError
 from app.admin_routes import router as admin_router
+from app import metrics
+from app.metrics import STAGE_SECONDS, REJECTIONS
 
 app = FastAPI(title="Secure Token Gateway")
 security = HTTPBearer()
 
-app.include_router(admin_router)
+app.include_router(admin_router, dependencies=[Depends(limit_by_ip)])
 
 # ================= RATE LIMIT =================
 
-app.state.limiter = limiter
-app.add_middleware(SlowAPIMiddleware)
-
 @app.exception_handler(RateLimitExceeded)
 def rate_limit_handler(request, exc):
+    return too_many_requests(exc.retry_after)
+
+@app.exception_handler(SigningBusyError)
+def signing_busy_handler(request, exc):
+    REJECTIONS.labels("signing_busy").inc()
     return JSONResponse(
-        status_code=429,
-        content={"detail": "Too many requests"},
+        status_code=503,
+        content={"detail": "Token signing overloaded, retry later"},
+        headers={"Retry-After": "1"},
     )
 
 # ================= STARTUP =================
 
 @app.on_event("startup")
 def startup():
-    generate_rsa_keys()
+    generate_jwt_keys()
+    generate_signing_keys()
+    ensure_indexes()
+    audit_writer.start()
+    batch_sealer.start()
+    token_store.start()
+    signing_engine.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    token_store.stop()
+    signing_engine.stop()
 
-# ================= DEV STORAGE =================
+    # Flush every accepted audit event before the process exits
+    audit_writer.stop()
+    batch_sealer.stop()
+    shutdown_verify_pool()
+    shutdown_executors()
 
-registered_devices: dict[str, dict[str, str]] = {}
+
+@app.on_event("shutdown")
+async def close_async_clients():
+    await async_redis_client.aclose()
+    await async_mongo_client.close()
+
+# Per-IP gate ahead of routing; inside CORS so a 429 stays readable
+app.add_middleware(RateLimitMiddleware)
 
 # ================= CORS =================
 
@@ -62,69 +112,191 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ================= METRICS =================
+
+# Outermost, so the timing includes the other middleware
+app.add_middleware(metrics.RequestMetricsMiddleware)
+
+_DEVICE_LOOKUP = STAGE_SECONDS.labels("device_lookup")
+
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # ================= REGISTER DEVICE =================
 
-@app.post("/register-device")
-def register_device(user_id: str, device_id: str, public_key: str):
-    registered_devices.setdefault(user_id, {})
-    registered_devices[user_id][device_id] = public_key
+@app.post("/register-device", dependencies=[Depends(limit_by_ip)])
+async def register_device(user_id: str, device_id: str, public_key: str):
+    await run_io(device_store.register_device, user_id, device_id, public_key)
 
-    log_event(user_id, device_id, "REGISTER_DEVICE", "SUCCESS")
+    await log_event_async(user_id, device_id, "REGISTER_DEVICE", "SUCCESS")
     return {"status": "registered"}
 
+# ================= BULK REGISTER DEVICES =================
+
+REGISTER_BATCH_MAX = int(os.getenv("REGISTER_BATCH_MAX", "1000"))
+
+
+class DeviceRegistration(BaseModel):
+    user_id: str
+    device_id: str
+    public_key: str
+
+
+@app.post("/register-devices", dependencies=[Depends(limit_by_ip)])
+async def register_devices(request: Request, registrations: list[DeviceRegistration]):
+    limit = min(REGISTER_BATCH_MAX, max_batch_items(request))
+    if len(registrations) > limit:
+        raise HTTPException(413, f"at most {limit} devices per batch")
+
+    # Priced per device, like /register-device
+    await enforce_items(request, len(registrations))
+
+    # Last entry wins for a device listed twice
+    unique = {(r.user_id, r.device_id): r.public_key for r in registrations}
+    items = [(user_id, device_id, public_key) for (user_id, device_id), public_key in unique.items()]
+
+    registered = await run_io(device_store.register_devices, items)
+
+    if items:
+        await log_events_async([
+            (user_id, device_id, "REGISTER_DEVICE", "SUCCESS")
+            for user_id, device_id, _ in items
+        ])
+
+    return {"registered": registered}
+
 # ================= ISSUE TOKEN =================
 
-@app.post("/issue-token")
-def issue_token(user_id: str, device_id: str):
+@app.post("/issue-token", dependencies=[Depends(limit_by_ip)])
+async def issue_token(user_id: str, device_id: str):
 
-    if user_id not in registered_devices:
-        raise HTTPException(403, "user not registered")
+    # Cache hits skip the Mongo round-trip and the thread hop
+    with _DEVICE_LOOKUP.time():
+        public_key = device_store.peek_device_key(user_id, device_id)
+        if public_key is None:
+            public_key = await run_io(device_store.get_device_key, user_id, device_id)
 
-    if device_id not in registered_devices[user_id]:
+    if public_key is None:
+        if not await run_io(device_store.has_user, user_id):
+            REJECTIONS.labels("user_not_registered").inc()
+            raise HTTPException(403, "user not registered")
+        REJECTIONS.labels("device_not_registered").inc()
         raise HTTPException(403, "device not registered")
 
-    token = generate_token(
-        user_id,
-        device_id,
-        registered_devices[user_id][device_id],
-    )
+    token = await generate_token_async(user_id, device_id, public_key)
 
-    log_event(user_id, device_id, "ISSUE_TOKEN", "SUCCESS")
+    await log_event_async(user_id, device_id, "ISSUE_TOKEN", "SUCCESS")
 
     return {"access_token": token}
 
+# ================= BATCH ISSUE TOKENS =================
+
+ISSUE_BATCH_MAX = int(os.getenv("ISSUE_BATCH_MAX", "1000"))
+
+
+class DeviceRef(BaseModel):
+    user_id: str
+    device_id: str
+
+
+@app.post("/issue-tokens", dependencies=[Depends(limit_by_ip)])
+async def issue_tokens(request: Request, devices: list[DeviceRef]):
+    limit = min(ISSUE_BATCH_MAX, max_batch_items(request))
+    if len(devices) > limit:
+        raise HTTPException(413, f"at most {limit} devices per batch")
+
+    # Priced per token, like /issue-token
+    await enforce_items(request, len(devices))
+
+    with _DEVICE_LOOKUP.time():
+        public_keys = await run_io(
+            device_store.get_device_keys,
+            [(d.user_id, d.device_id) for d in devices],
+        )
+
+    results = [None] * len(devices)
+    pending = []
+    seen = set()
+
+    for i, (d, public_key) in enumerate(zip(devices, public_keys)):
+        device_key = (d.user_id, d.device_id)
+
+        if public_key is None:
+            error = "device not registered"
+        elif device_key in seen:
+            error = "duplicate device in batch"
+        else:
+            seen.add(device_key)
+            pending.append((i, (d.user_id, d.device_id, public_key)))
+            continue
+
+        results[i] = {"user_id": d.user_id, "device_id": d.device_id, "error": error}
+
+    # Signed concurrently; the signing engine bounds how many are in flight
+    signed = await asyncio.gather(
+        *(generate_token_async(*item) for _, item in pending),
+        return_exceptions=True,
+    )
+
+    audit_events = []
+
+    for (i, (user_id, device_id, _)), token in zip(pending, signed):
+        if isinstance(token, Exception):
+            error = "signing overloaded" if isinstance(token, SigningBusyError) else "token signing failed"
+            results[i] = {"user_id": user_id, "device_id": device_id, "error": error}
+            continue
+
+        results[i] = {"user_id": user_id, "device_id": device_id, "access_token": token}
+        audit_events.append((user_id, device_id, "ISSUE_TOKEN", "SUCCESS"))
+
+    if audit_events:
+        await log_events_async(audit_events)
+
+    return {
+        "issued": len(audit_events),
+        "failed": len(devices) - len(audit_events),
+        "results": results,
+    }
+
 # ================= PROTECTED RESOURCE =================
 
 @app.get("/protected")
-def protected(
+async def protected(
     request: Request,
     creds: HTTPAuthorizationCredentials = Depends(security),
     x_pop_signature: str = Header(..., alias="X-Pop-Signature"),
 ):
-    payload = verify_jwt(creds.credentials)
+    payload = await verify_jwt_async(creds.credentials)
 
+    # Verified callers are limited per device, the rest per client IP
     if not payload:
+        await enforce(request)
         raise HTTPException(401, "invalid or expired token")
 
-    # 🔁 Replay guard (JTI)
-    if check_and_mark_jti(payload["jti"]):
-        log_event(payload["sub"], payload["device_id"], "ACCESS_DENIED", "REPLAY_JTI")
+    await enforce(request, device_identity(payload))
+
+    # 🔁 Replay guard (JTI + signature reuse, one Redis round-trip)
+    replay = await check_and_mark_async(payload["jti"], x_pop_signature)
+
+    if replay == REPLAY_JTI:
+        await log_event_async(payload["sub"], payload["device_id"], "ACCESS_DENIED", "REPLAY_JTI")
         raise HTTPException(403, "replay detected")
 
-    # 🔁 Replay guard (signature reuse)
-    if check_and_mark_signature(x_pop_signature):
-        log_event(payload["sub"], payload["device_id"], "ACCESS_DENIED", "REPLAY_SIGNATURE")
+    if replay:
+        await log_event_async(payload["sub"], payload["device_id"], "ACCESS_DENIED", "REPLAY_SIGNATURE")
         raise HTTPException(403, "signature replay")
 
     # 🔐 Proof of Possession
     message = f"ACCESS:{payload['jti']}".encode()
     public_key = payload["cnf"]["pk"]
 
-    if not verify_pop_signature(message, x_pop_signature, public_key):
-        log_event(payload["sub"], payload["device_id"], "ACCESS_DENIED", "BAD_SIGNATURE")
+    if not await run_cpu(verify_pop_signature, message, x_pop_signature, public_key):
+        await log_event_async(payload["sub"], payload["device_id"], "ACCESS_DENIED", "BAD_SIGNATURE")
         raise HTTPException(403, "bad signature")
 
-    log_event(
+    await log_event_async(
         payload["sub"],
         payload["device_id"],
         "ACCESS_GRANTED",
@@ -137,29 +309,33 @@ def protected(
 # ================= ROTATE TOKEN =================
 
 @app.post("/rotate-token")
-def rotate_token(
+async def rotate_token(
+    request: Request,
     creds: HTTPAuthorizationCredentials = Depends(security),
     x_pop_signature: str = Header(..., alias="X-Pop-Signature"),
 ):
-    payload = verify_jwt(creds.credentials)
+    payload = await verify_jwt_async(creds.credentials)
 
     if not payload:
+        await enforce(request)
         raise HTTPException(401, "invalid or expired token")
 
+    await enforce(request, device_identity(payload))
+
     # 🔐 Verify PoP for rotation
     message = f"ROTATE:{payload['jti']}".encode()
 
-    if not verify_pop_signature(message, x_pop_signature, payload["cnf"]["pk"]):
-        log_event(payload["sub"], payload["device_id"], "ROTATE_DENIED", "BAD_SIGNATURE")
+    if not await run_cpu(verify_pop_signature, message, x_pop_signature, payload["cnf"]["pk"]):
+        await log_event_async(payload["sub"], payload["device_id"], "ROTATE_DENIED", "BAD_SIGNATURE")
         raise HTTPException(403, "bad signature")
 
-    # 🔁 Issue new token (old one auto‑revoked inside generate_token)
-    new_token = generate_token(
+    # 🔁 Issue new token (old one auto‑revoked on activation)
+    new_token = await generate_token_async(
         payload["sub"],
         payload["device_id"],
         payload["cnf"]["pk"],
     )
 
-    log_event(payload["sub"], payload["device_id"], "TOKEN_ROTATED", "SUCCESS")
+    await log_event_async(payload["sub"], payload["device_id"], "TOKEN_ROTATED", "SUCCESS")
 
     return {"access_token": new_token}
\ No newline at end of file
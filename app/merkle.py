@@ -0,0 +1,68 @@
+import hashlib
+
+# RFC 6962 domain separation between leaves and interior nodes
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def leaf_hash(record_hash: str) -> bytes:
+    return hashlib.sha256(LEAF_PREFIX + bytes.fromhex(record_hash)).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def _levels(leaves: list[bytes]) -> list[list[bytes]]:
+    # An odd node at the end of a level is promoted unchanged. Audit
+    # batches are powers of two, so this never happens for them.
+    levels = [leaves]
+
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [
+            node_hash(level[i], level[i + 1])
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+
+    return levels
+
+
+def merkle_root(leaves: list[bytes]) -> bytes:
+    if not leaves:
+        raise ValueError("Merkle tree needs at least one leaf")
+    return _levels(leaves)[-1][0]
+
+
+def inclusion_proof(leaves: list[bytes], index: int) -> list[dict]:
+    if not 0 <= index < len(leaves):
+        raise IndexError(f"Leaf index {index} out of range")
+
+    proof = []
+
+    for level in _levels(leaves)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({
+                "side": "left" if sibling < index else "right",
+                "hash": level[sibling].hex(),
+            })
+        index //= 2
+
+    return proof
+
+
+def verify_inclusion(leaf: bytes, proof: list[dict], root: bytes) -> bool:
+    node = leaf
+
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        if step["side"] == "left":
+            node = node_hash(sibling, node)
+        else:
+            node = node_hash(node, sibling)
+
+    return node == root
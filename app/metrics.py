@@ -0,0 +1,309 @@
+import time
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+
+# ===============================
+# CONFIG
+# ===============================
+
+# Seconds; covers a cached JWT check (~10 us) up to a slow Mongo round-trip
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+# ===============================
+# METRIC TYPES
+# ===============================
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=(), collect=None):
+        """
+        collect: optional callable returning {label values tuple: value},
+        read at scrape time instead of being updated on the hot path.
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._collect = collect
+        self._children = {}
+        self._lock = threading.Lock()
+
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """Returns the per-label-set child that holds this metric's state."""
+
+    def _default(self):
+        return self.labels()
+
+    def _samples(self):
+        if self._collect is not None:
+            for values, value in self._collect().items():
+                yield self.name, values, (), value
+            return
+
+        for values, child in list(self._children.items()):
+            for suffix, extra, value in child.samples():
+                yield self.name + suffix, values, extra, value
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for name, values, extra, value in self._samples():
+            labels = _format_labels(self.labelnames, values, extra)
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self):
+        yield "", (), self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default().dec(amount)
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # Per-bucket (non-cumulative) counts; the last slot is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += count
+            yield "_bucket", (("le", _format_value(float(bound))),), cumulative
+
+        yield "_sum", (), total
+        yield "_count", (), cumulative
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+# ===============================
+# EXPOSITION
+# ===============================
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ===============================
+# GATEWAY METRICS
+# ===============================
+
+REQUEST_SECONDS = Histogram(
+    "gateway_request_seconds",
+    "HTTP request latency by route and status code.",
+    labelnames=("route", "status"),
+)
+
+STAGE_SECONDS = Histogram(
+    "gateway_stage_seconds",
+    "Latency of individual request pipeline stages.",
+    labelnames=("stage",),
+)
+
+REJECTIONS = Counter(
+    "gateway_rejections_total",
+    "Requests or tokens rejected, by reason.",
+    labelnames=("reason",),
+)
+
+REPLAYS = Counter(
+    "gateway_replays_total",
+    "Replayed PoP requests caught by the replay guard.",
+    labelnames=("kind",),
+)
+
+_caches = {}
+
+
+def track_cache(name: str, cache):
+    """Expose an LRUCache's hit/miss counters and size."""
+    _caches[name] = cache
+
+
+def _cache_stat(field):
+    return lambda: {(name,): cache.stats()[field] for name, cache in _caches.items()}
+
+
+Counter(
+    "gateway_cache_hits_total",
+    "Cache hits by cache.",
+    labelnames=("cache",),
+    collect=_cache_stat("hits"),
+)
+
+Counter(
+    "gateway_cache_misses_total",
+    "Cache misses by cache.",
+    labelnames=("cache",),
+    collect=_cache_stat("misses"),
+)
+
+Gauge(
+    "gateway_cache_entries",
+    "Entries currently held, by cache.",
+    labelnames=("cache",),
+    collect=_cache_stat("size"),
+)
+
+# ===============================
+# ASGI MIDDLEWARE
+# ===============================
+
+class RequestMetricsMiddleware:
+    """Times every HTTP request into REQUEST_SECONDS (pure ASGI, no body buffering)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Route template, so path parameters don't explode cardinality
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.labels(path, str(status)).observe(time.perf_counter() - start)
@@ -1,11 +1,378 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 import os
+import time
+import math
 
-# Default: 60 requests per minute per IP
+from redis.exceptions import RedisError
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from app.redis_client import async_redis_client
+from app.lru_cache import LRUCache
+from app.metrics import Counter, REJECTIONS
+
+# ===============================
+# CONFIG
+# ===============================
+
+# Default: 60 cost units per minute per identity (device, else client IP)
 DEFAULT_RATE = os.getenv("RATE_LIMIT", "60/minute")
 
-limiter = Limiter(
-    key_func=get_remote_address,
-    default_limits=[DEFAULT_RATE],
+# Flat per-IP gate in front of routing, one unit per request of any kind
+IP_RATE = os.getenv("RATE_LIMIT_IP", "600/minute")
+
+# Batch routes charge every item what the single-item route costs, to a
+# separate per-IP provisioning budget so one batch can exceed RATE_LIMIT
+BATCH_RATE = os.getenv("RATE_LIMIT_BATCH", "5000/minute")
+
+# redis: shared by every worker / replica | memory: this process only
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "redis")
+
+# Upper bound on units reserved from Redis in one round-trip
+RATE_LIMIT_MAX_LEASE = int(os.getenv("RATE_LIMIT_MAX_LEASE", "16"))
+# Unused leased units are dropped after this many seconds
+RATE_LIMIT_LEASE_TTL = float(os.getenv("RATE_LIMIT_LEASE_TTL", "1"))
+RATE_LIMIT_LOCAL_KEYS = int(os.getenv("RATE_LIMIT_LOCAL_KEYS", "100000"))
+
+# RSA signing routes cost more than a verification
+DEFAULT_ROUTE_COSTS = {
+    "/issue-token": 5,
+    "/rotate-token": 5,
+}
+
+# batch route -> the route each of its items is priced as
+BATCH_ITEM_ROUTES = {
+    "/issue-tokens": "/issue-token",
+    "/register-devices": "/register-device",
+}
+
+KEY_PREFIX = "rl:"
+
+_PERIODS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("rate limit exceeded")
+        self.retry_after = retry_after
+
+
+def parse_rate(rate: str):
+    """'60/minute' -> (60, 60.0 seconds)"""
+    try:
+        amount, _, unit = rate.partition("/")
+        return int(amount), float(_PERIODS[unit.strip().rstrip("s")])
+    except (ValueError, KeyError):
+        raise RuntimeError(f"Invalid rate {rate!r} (expected e.g. 60/minute)")
+
+
+def _load_route_costs():
+    # A cost above the limit could never be granted
+    limit = parse_rate(DEFAULT_RATE)[0]
+    costs = {path: min(cost, limit) for path, cost in DEFAULT_ROUTE_COSTS.items()}
+
+    # "/issue-token=5,/protected=1"
+    for entry in os.getenv("RATE_LIMIT_COSTS", "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        path, sep, cost = entry.rpartition("=")
+        if not sep or not cost.isdigit():
+            raise RuntimeError(f"Invalid RATE_LIMIT_COSTS entry: {entry}")
+        if int(cost) > limit:
+            raise RuntimeError(
+                f"RATE_LIMIT_COSTS entry {entry} exceeds RATE_LIMIT {DEFAULT_RATE}"
+            )
+
+        costs[path] = int(cost)
+
+    return costs
+
+ROUTE_COSTS = _load_route_costs()
+
+CHECKS = Counter(
+    "gateway_rate_limit_checks_total",
+    "Rate-limit decisions by where they were made.",
+    labelnames=("source",),
+)
+
+_LOCAL = CHECKS.labels("local")
+_BACKEND = CHECKS.labels("backend")
+
+FALLBACKS = Counter(
+    "gateway_rate_limit_fallbacks_total",
+    "Rate-limit decisions made in-process because Redis failed.",
+)
+
+# ===============================
+# GCRA BACKENDS
+# ===============================
+
+# Generic cell rate algorithm. Each unit advances the key's theoretical
+# arrival time (TAT) by one emission interval; a request is allowed while
+# TAT stays within the burst tolerance of now. Grants up to ARGV[3] units
+# (a lease) but at least ARGV[4], or nothing.
+# KEYS[1] limiter key
+# ARGV: emission interval ms, burst tolerance ms, wanted units, needed units
+# Returns {granted, retry_after_ms}
+_GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local need = tonumber(ARGV[4])
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+  tat = now
+end
+
+local available = math.floor((now + tolerance - tat) / interval)
+if available < need then
+  return {0, math.ceil(tat + interval * need - tolerance - now)}
+end
+
+local granted = math.min(want, available)
+tat = tat + interval * granted
+redis.call('SET', KEYS[1], tat, 'PX', math.ceil(tat - now))
+return {granted, 0}
+"""
+
+
+class RedisGCRA:
+    """
+    Shared state in Redis. While Redis is failing, decisions fall back to
+    a per-process MemoryGCRA, so limits loosen to per worker instead of
+    every request failing.
+    """
+
+    def __init__(self, client):
+        self._script = client.register_script(_GCRA_LUA)
+        self._fallback = MemoryGCRA()
+
+    async def acquire(self, key: str, interval: float, tolerance: float, want: int, need: int):
+        try:
+            granted, retry_ms = await self._script(
+                keys=[KEY_PREFIX + key],
+                args=[interval * 1000, tolerance * 1000, want, need],
+            )
+        except RedisError:
+            FALLBACKS.inc()
+            return await self._fallback.acquire(key, interval, tolerance, want, need)
+
+        return int(granted), int(retry_ms) / 1000
+
+
+class MemoryGCRA:
+    """Same algorithm, state kept in this process."""
+
+    def __init__(self):
+        self._tat = LRUCache(RATE_LIMIT_LOCAL_KEYS)
+
+    async def acquire(self, key: str, interval: float, tolerance: float, want: int, need: int):
+        now = time.monotonic()
+        tat = max(self._tat.get(key, now), now)
+
+        available = math.floor((now + tolerance - tat) / interval)
+        if available < need:
+            return 0, tat + interval * need - tolerance - now
+
+        granted = min(want, available)
+        tat += interval * granted
+        self._tat.set(key, tat, expires_at=time.time() + (tat - now))
+        return granted, 0.0
+
+# ===============================
+# LIMITER
+# ===============================
+
+class _Lease:
+    __slots__ = ("units", "expires", "size", "blocked_until")
+
+    def __init__(self):
+        self.units = 0
+        self.expires = 0.0
+        self.size = 0
+        self.blocked_until = 0.0
+
+
+class RateLimiter:
+    """
+    GCRA limiter with a per-process fast path.
+
+    A key that keeps coming back reserves units from the backend in leases
+    that double up to max_lease, and spends them locally until they run
+    out or expire. An occasional caller gets exactly its cost each time,
+    so it is never charged for units it does not use. Denials are
+    remembered locally until the retry time. Across N processes a key can
+    be under-served by at most N unexpired leases, and is never over-served.
+    """
+
+    def __init__(self, backend, rate: str, max_lease: int, lease_ttl: float):
+        self.backend = backend
+        self.limit, period = parse_rate(rate)
+        self.interval = period / self.limit
+        self.tolerance = period
+        self.max_lease = max(1, min(max_lease, self.limit))
+        self.lease_ttl = lease_ttl
+        self._leases = LRUCache(RATE_LIMIT_LOCAL_KEYS)
+
+    async def hit(self, key: str, cost: int = 1):
+        """Charges `cost` units to `key`; raises RateLimitExceeded when over."""
+        now = time.monotonic()
+
+        lease = self._leases.get(key)
+        if lease is None:
+            lease = _Lease()
+            self._leases.set(key, lease)
+
+        if lease.blocked_until > now:
+            _LOCAL.inc()
+            raise RateLimitExceeded(lease.blocked_until - now)
+
+        if lease.expires > now and lease.units >= cost:
+            lease.units -= cost
+            _LOCAL.inc()
+            return
+
+        # Came back while the last lease was live: reserve a bigger one
+        if lease.expires > now:
+            lease.size = min(max(lease.size * 2, 1), self.max_lease)
+        else:
+            lease.units = 0
+            lease.size = 0
+
+        _BACKEND.inc()
+        granted, retry_after = await self.backend.acquire(
+            key,
+            self.interval,
+            self.tolerance,
+            max(cost, lease.size),
+            cost,
+        )
+
+        if not granted:
+            lease.blocked_until = now + retry_after
+            raise RateLimitExceeded(retry_after)
+
+        lease.units += granted - cost
+        lease.expires = now + self.lease_ttl
+
+
+def _build_backend():
+    if RATE_LIMIT_STORE == "redis":
+        return RedisGCRA(async_redis_client)
+    if RATE_LIMIT_STORE == "memory":
+        return MemoryGCRA()
+    raise RuntimeError(f"Unknown RATE_LIMIT_STORE {RATE_LIMIT_STORE!r} (expected redis or memory)")
+
+
+limiter = RateLimiter(
+    _build_backend(),
+    DEFAULT_RATE,
+    max_lease=RATE_LIMIT_MAX_LEASE,
+    lease_ttl=RATE_LIMIT_LEASE_TTL,
 )
+
+ip_limiter = RateLimiter(
+    _build_backend(),
+    IP_RATE,
+    max_lease=RATE_LIMIT_MAX_LEASE,
+    lease_ttl=RATE_LIMIT_LEASE_TTL,
+)
+
+batch_limiter = RateLimiter(
+    _build_backend(),
+    BATCH_RATE,
+    max_lease=RATE_LIMIT_MAX_LEASE,
+    lease_ttl=RATE_LIMIT_LEASE_TTL,
+)
+
+# ===============================
+# FASTAPI HOOKS
+# ===============================
+
+def too_many_requests(retry_after: float) -> JSONResponse:
+    REJECTIONS.labels("rate_limited").inc()
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests"},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class RateLimitMiddleware:
+    """
+    Charges every HTTP request to its client IP before routing (pure
+    ASGI), so requests that fail header validation, JWT verification or
+    never reach a limited route still count. Route costs and per-device
+    limits are applied later by enforce().
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        try:
+            await ip_limiter.hit(f"ipgate:{client[0] if client else 'unknown'}")
+        except RateLimitExceeded as exc:
+            await too_many_requests(exc.retry_after)(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+
+def _route_path(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", request.url.path)
+
+
+def _client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def route_cost(request: Request) -> int:
+    return ROUTE_COSTS.get(_route_path(request), 1)
+
+
+def item_cost(request: Request) -> int:
+    return ROUTE_COSTS.get(BATCH_ITEM_ROUTES[_route_path(request)], 1)
+
+
+def max_batch_items(request: Request) -> int:
+    """Largest batch the provisioning budget can ever grant for this route."""
+    return batch_limiter.limit // item_cost(request)
+
+
+async def enforce(request: Request, identity: str | None = None):
+    """Charges the route's cost to `identity`, or to the client IP."""
+    if identity is None:
+        identity = f"ip:{_client_ip(request)}"
+
+    await limiter.hit(identity, route_cost(request))
+
+
+async def enforce_items(request: Request, count: int):
+    """Charges `count` items of a batch route to the client IP's provisioning budget."""
+    if count:
+        await batch_limiter.hit(f"batch:ip:{_client_ip(request)}", count * item_cost(request))
+
+
+async def limit_by_ip(request: Request):
+    # Dependency for routes without a verified identity
+    await enforce(request)
+
+
+def device_identity(payload: dict) -> str:
+    return f"device:{payload['sub']}:{payload['device_id']}"
@@ -1,5 +1,6 @@
 import os
 import redis
+import redis.asyncio
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
@@ -7,3 +8,9 @@ redis_client = redis.Redis.from_url(
     REDIS_URL,
     decode_responses=True,
 )
+
+# Used by async request handlers
+async_redis_client = redis.asyncio.Redis.from_url(
+    REDIS_URL,
+    decode_responses=True,
+)
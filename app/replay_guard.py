@@ -1,5 +1,6 @@
 import hashlib
-from app.redis_client import redis_client
+from app.redis_client import redis_client, async_redis_client
+from app.metrics import STAGE_SECONDS, REPLAYS
 
 # ===============================
 # CONFIG
@@ -8,26 +9,87 @@ from app.redis_client import redis_client
 JTI_TTL_SECONDS = 300        # 5 minutes
 SIG_TTL_SECONDS = 60         # PoP signatures are very short-lived
 
+REPLAY_JTI = "jti"
+REPLAY_SIGNATURE = "signature"
+
 # ===============================
 # HELPERS
 # ===============================
 
 def _hash(value: str) -> str:
-    return hashlib.sha256(value.encode()).hexdigest()
+    # 128-bit digest: fixed-size keys regardless of signature length
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def _jti_key(jti: str) -> str:
+    return f"jti:{_hash(jti)}"
+
+
+def _sig_key(sig: str) -> str:
+    return f"sig:{_hash(sig)}"
+
+
+# Marks jti, then signature, stopping at the first one already seen.
+# Same semantics as the two separate SET NX calls, in one round-trip.
+# 0 = fresh, 1 = jti replay, 2 = signature replay
+_CHECK_AND_MARK_LUA = """
+if not redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1]) then
+  return 1
+end
+if not redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[2]) then
+  return 2
+end
+return 0
+"""
+
+_CHECK_AND_MARK_SCRIPT = redis_client.register_script(_CHECK_AND_MARK_LUA)
+_CHECK_AND_MARK_SCRIPT_ASYNC = async_redis_client.register_script(_CHECK_AND_MARK_LUA)
+
+
+_REPLAY_CHECK = STAGE_SECONDS.labels("replay_check")
+
+
+def _replay_result(result):
+    if result == 1:
+        REPLAYS.labels(REPLAY_JTI).inc()
+        return REPLAY_JTI
+    if result == 2:
+        REPLAYS.labels(REPLAY_SIGNATURE).inc()
+        return REPLAY_SIGNATURE
+    return None
 
 # ===============================
 # REPLAY CHECKS
 # ===============================
 
+def check_and_mark(jti: str, sig: str):
+    """
+    Returns None if fresh, otherwise REPLAY_JTI or REPLAY_SIGNATURE
+    """
+    with _REPLAY_CHECK.time():
+        result = _CHECK_AND_MARK_SCRIPT(
+            keys=[_jti_key(jti), _sig_key(sig)],
+            args=[JTI_TTL_SECONDS, SIG_TTL_SECONDS],
+        )
+    return _replay_result(result)
+
+
+async def check_and_mark_async(jti: str, sig: str):
+    with _REPLAY_CHECK.time():
+        result = await _CHECK_AND_MARK_SCRIPT_ASYNC(
+            keys=[_jti_key(jti), _sig_key(sig)],
+            args=[JTI_TTL_SECONDS, SIG_TTL_SECONDS],
+        )
+    return _replay_result(result)
+
+
 # app/replay_guard.py
 def check_and_mark_jti(jti: str) -> bool:
     """
     Returns True ONLY if this is a replay
     """
-    key = f"jti:{jti}"
-
     inserted = redis_client.set(
-        key,
+        _jti_key(jti),
         "1",
         nx=True,
         ex=JTI_TTL_SECONDS,
@@ -40,14 +102,11 @@ def check_and_mark_jti(jti: str) -> bool:
 
 
 def check_and_mark_signature(sig: str) -> bool:
-    key = f"sig:{sig}"
-
     inserted = redis_client.set(
-        key,
+        _sig_key(sig),
         "1",
         nx=True,
         ex=SIG_TTL_SECONDS,
     )
 
     return inserted is None
-
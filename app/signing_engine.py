@@ -0,0 +1,141 @@
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import jwt
+
+from app.key_manager import load_private_key
+from app.algorithms import algorithm_for_key
+from app.executor import run_cpu
+
+# ===============================
+# CONFIG
+# ===============================
+
+# 0 = sign on the calling thread (no pool)
+JWT_SIGN_WORKERS = int(os.getenv("JWT_SIGN_WORKERS", "0"))
+JWT_SIGN_MAX_PENDING = int(os.getenv("JWT_SIGN_MAX_PENDING", "256"))
+JWT_SIGN_QUEUE_TIMEOUT = float(os.getenv("JWT_SIGN_QUEUE_TIMEOUT", "2"))   # seconds
+
+
+class SigningBusyError(RuntimeError):
+    pass
+
+
+# ===============================
+# WORKER SIDE
+# ===============================
+
+def _init_worker():
+    # Parse the private key once per worker; later calls hit the key cache
+    load_private_key()
+
+
+def _sign(payload: dict) -> str:
+    # alg follows the key type and lands in the token header
+    private_key = load_private_key()
+    return jwt.encode(
+        payload,
+        private_key,
+        algorithm=algorithm_for_key(private_key),
+    )
+
+
+# ===============================
+# ENGINE
+# ===============================
+
+class SigningEngine:
+    """
+    JWT signing on a process pool, so RSA private-key operations scale
+    past one core. At most `max_pending` signatures are queued; callers
+    beyond that wait up to JWT_SIGN_QUEUE_TIMEOUT and then get
+    SigningBusyError. With workers=0 (or before start()) tokens are
+    signed in-process.
+
+    Async handlers use sign_async(), which submits straight from the
+    event loop and waits on an asyncio semaphore. sign() keeps its own
+    thread-side budget for scripts and worker threads. A pool that breaks
+    (a worker died) is replaced, and the affected request is signed
+    in-process.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._async_slots = asyncio.Semaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def start(self):
+        with self._pool_lock:
+            if self.workers <= 0 or self._pool is not None:
+                return
+            self._pool = self._new_pool()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def _replace_broken(self, pool):
+        with self._pool_lock:
+            # Another caller may already have swapped it out, or stop() ran
+            if self._pool is not pool:
+                return
+            self._pool = self._new_pool()
+
+        print("JWT signing pool broke, restarted it")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def stop(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def sign(self, payload: dict) -> str:
+        pool = self._pool
+        if pool is None:
+            return _sign(payload)
+
+        if not self._slots.acquire(timeout=JWT_SIGN_QUEUE_TIMEOUT):
+            raise SigningBusyError("token signing queue is full")
+
+        try:
+            return pool.submit(_sign, payload).result()
+        except BrokenProcessPool:
+            self._replace_broken(pool)
+            return _sign(payload)
+        finally:
+            self._slots.release()
+
+    async def sign_async(self, payload: dict) -> str:
+        pool = self._pool
+        if pool is None:
+            return await run_cpu(_sign, payload)
+
+        try:
+            await asyncio.wait_for(self._async_slots.acquire(), JWT_SIGN_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise SigningBusyError("token signing queue is full")
+
+        try:
+            return await asyncio.wrap_future(pool.submit(_sign, payload))
+        except BrokenProcessPool:
+            self._replace_broken(pool)
+            return await run_cpu(_sign, payload)
+        finally:
+            self._async_slots.release()
+
+
+signing_engine = SigningEngine(
+    workers=JWT_SIGN_WORKERS,
+    max_pending=JWT_SIGN_MAX_PENDING,
+)
@@ -0,0 +1,260 @@
+import os
+import time
+
+from app.lru_cache import LRUCache
+from app.metrics import Gauge, track_cache
+from app.redis_client import redis_client, async_redis_client
+from app import data_store
+
+# ===============================
+# CONFIG
+# ===============================
+
+# memory: single process (default) | redis: shared across workers / replicas
+TOKEN_STORE = os.getenv("TOKEN_STORE", "memory")
+
+NEAR_CACHE_SIZE = int(os.getenv("TOKEN_NEAR_CACHE_SIZE", "50000"))
+NEAR_CACHE_TTL = float(os.getenv("TOKEN_NEAR_CACHE_TTL", "5"))   # seconds
+
+INVALIDATION_CHANNEL = "tok:invalidate"
+
+ACTIVE_PREFIX = "tok:active:"
+REVOKED_PREFIX = "tok:revoked:"
+
+
+# ===============================
+# IN-PROCESS STORE
+# ===============================
+
+class MemoryTokenStore:
+    """Process-local state from app.data_store (single worker only)."""
+
+    def start(self):
+        data_store.start_cleanup_ticker()
+
+    def stop(self):
+        data_store.stop_cleanup_ticker()
+
+    def cleanup(self):
+        data_store.cleanup_expired_tokens()
+
+    def activate(self, device_key: str, jti: str, exp: int):
+        data_store.activate_token(device_key, jti, exp)
+
+    def get_active(self, device_key: str):
+        return data_store.active_device_tokens.get(device_key)
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in data_store.revoked_tokens
+
+    # In-process state: the async forms never wait on I/O
+
+    async def activate_async(self, device_key: str, jti: str, exp: int):
+        self.activate(device_key, jti, exp)
+
+    async def get_active_async(self, device_key: str):
+        return self.get_active(device_key)
+
+    async def is_revoked_async(self, jti: str) -> bool:
+        return self.is_revoked(jti)
+
+    def counts(self):
+        return {
+            "active": len(data_store.active_device_tokens),
+            "revoked": len(data_store.revoked_tokens),
+        }
+
+
+# ===============================
+# REDIS STORE
+# ===============================
+
+# Swaps the active token for a device and revokes the previous one,
+# atomically, then tells every worker to drop its near-cache entries.
+# KEYS[1] active key
+# ARGV: jti, exp, now, revoked prefix, channel
+_ACTIVATE_SCRIPT = """
+local old = redis.call('GET', KEYS[1])
+local old_jti = ''
+if old then
+  local sep = string.find(old, '|', 1, true)
+  old_jti = string.sub(old, 1, sep - 1)
+  local old_exp = tonumber(string.sub(old, sep + 1))
+  if old_exp > tonumber(ARGV[3]) then
+    redis.call('SET', ARGV[4] .. old_jti, '1', 'EXAT', old_exp)
+  end
+end
+redis.call('SET', KEYS[1], ARGV[1] .. '|' .. ARGV[2], 'EXAT', ARGV[2])
+redis.call('PUBLISH', ARGV[5], 'active|' .. KEYS[1] .. '|' .. old_jti)
+return old_jti
+"""
+
+
+class RedisTokenStore:
+    """
+    Token state shared through Redis, with a per-process near-cache.
+
+    Every key carries EXAT = token exp, so Redis expires state by itself.
+    Rotations publish on INVALIDATION_CHANNEL; each worker evicts the
+    affected near-cache entries. NEAR_CACHE_TTL bounds
+    staleness if an invalidation message is lost.
+
+    The *_async methods go through redis.asyncio, for request handlers;
+    both forms share the near-cache.
+    """
+
+    def __init__(self, client, async_client):
+        self.client = client
+        self.async_client = async_client
+        self._activate = client.register_script(_ACTIVATE_SCRIPT)
+        self._activate_async = async_client.register_script(_ACTIVATE_SCRIPT)
+
+        self._active = LRUCache(NEAR_CACHE_SIZE, ttl=NEAR_CACHE_TTL)
+        self._revoked = LRUCache(NEAR_CACHE_SIZE, ttl=NEAR_CACHE_TTL)
+
+        track_cache("token_active", self._active)
+        track_cache("token_revoked", self._revoked)
+
+        self._pubsub = None
+        self._listener = None
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        if self._listener:
+            return
+
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_invalidate})
+        self._listener = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def stop(self):
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+        if self._pubsub:
+            self._pubsub.close()
+            self._pubsub = None
+
+    def _on_invalidate(self, message):
+        data = message["data"]
+        if isinstance(data, bytes):
+            data = data.decode()
+
+        kind, _, rest = data.partition("|")
+
+        if kind == "active":
+            active_key, _, old_jti = rest.rpartition("|")
+            self._active.pop(active_key[len(ACTIVE_PREFIX):])
+            if old_jti:
+                self._revoked.pop(old_jti)
+
+    # ---------- tokens ----------
+
+    def cleanup(self):
+        # Redis expires keys at token exp
+        pass
+
+    @staticmethod
+    def _activate_args(jti: str, exp: int):
+        return [jti, exp, int(time.time()), REVOKED_PREFIX, INVALIDATION_CHANNEL]
+
+    def _activated(self, device_key: str, jti: str, exp: int, old_jti):
+        entry = {"jti": jti, "exp": exp}
+        self._active.set(device_key, entry, expires_at=exp)
+
+        if old_jti:
+            if isinstance(old_jti, bytes):
+                old_jti = old_jti.decode()
+            self._revoked.set(old_jti, True)
+
+    def _loaded_active(self, device_key: str, raw):
+        if raw is None:
+            return None
+
+        jti, _, exp = raw.partition("|")
+        entry = {"jti": jti, "exp": int(exp)}
+        self._active.set(device_key, entry, expires_at=entry["exp"])
+        return entry
+
+    def activate(self, device_key: str, jti: str, exp: int):
+        old_jti = self._activate(
+            keys=[ACTIVE_PREFIX + device_key],
+            args=self._activate_args(jti, exp),
+        )
+        self._activated(device_key, jti, exp, old_jti)
+
+    async def activate_async(self, device_key: str, jti: str, exp: int):
+        old_jti = await self._activate_async(
+            keys=[ACTIVE_PREFIX + device_key],
+            args=self._activate_args(jti, exp),
+        )
+        self._activated(device_key, jti, exp, old_jti)
+
+    def get_active(self, device_key: str):
+        entry = self._active.get(device_key)
+        if entry is not None:
+            return entry
+
+        return self._loaded_active(device_key, self.client.get(ACTIVE_PREFIX + device_key))
+
+    async def get_active_async(self, device_key: str):
+        entry = self._active.get(device_key)
+        if entry is not None:
+            return entry
+
+        raw = await self.async_client.get(ACTIVE_PREFIX + device_key)
+        return self._loaded_active(device_key, raw)
+
+    def is_revoked(self, jti: str) -> bool:
+        cached = self._revoked.get(jti)
+        if cached is not None:
+            return cached
+
+        revoked = bool(self.client.exists(REVOKED_PREFIX + jti))
+        self._revoked.set(jti, revoked)
+        return revoked
+
+    async def is_revoked_async(self, jti: str) -> bool:
+        cached = self._revoked.get(jti)
+        if cached is not None:
+            return cached
+
+        revoked = bool(await self.async_client.exists(REVOKED_PREFIX + jti))
+        self._revoked.set(jti, revoked)
+        return revoked
+
+    def counts(self):
+        # Counting shared keys would need a keyspace SCAN per scrape
+        return None
+
+
+def _build_store():
+    if TOKEN_STORE == "redis":
+        return RedisTokenStore(redis_client, async_redis_client)
+    if TOKEN_STORE == "memory":
+        return MemoryTokenStore()
+    raise RuntimeError(f"Unknown TOKEN_STORE {TOKEN_STORE!r} (expected memory or redis)")
+
+
+token_store = _build_store()
+
+
+def _count(kind):
+    def collect():
+        counts = token_store.counts()
+        return {(): counts[kind]} if counts else {}
+    return collect
+
+
+Gauge(
+    "gateway_active_tokens",
+    "Devices holding an active token (memory store only).",
+    collect=_count("active"),
+)
+
+Gauge(
+    "gateway_revoked_tokens",
+    "Revoked, not yet expired tokens (memory store only).",
+    collect=_count("revoked"),
+)
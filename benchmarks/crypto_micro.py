@@ -0,0 +1,294 @@
+# benchmarks/crypto_micro.py
+#
+# Per-call cost of the crypto and hashing primitives on the request and
+# audit paths. Runs offline: gateway keys are generated in a temporary
+# directory and the token store is the in-process one.
+#
+# Usage (from the repo root):
+#   python -m benchmarks.crypto_micro
+#   python -m benchmarks.crypto_micro --output before.json
+#   python -m benchmarks.crypto_micro --compare before.json             # run now, compare
+#   python -m benchmarks.crypto_micro --compare before.json after.json  # compare two reports
+#
+# ops/s is the best of --repeat timed rounds. Python has no per-call
+# allocation counter, so allocations are reported as:
+#   peak_bytes       tracemalloc peak above the baseline during one call
+#   retained_blocks  memory blocks still alive per call afterwards
+#                    (caches and leaks show up here)
+
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import timeit
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+ALLOC_CALLS = 200
+
+
+# ===============================
+# ENVIRONMENT
+# ===============================
+
+def _prepare_env(jwt_alg: str):
+    os.environ.setdefault(
+        "AES_LOG_KEYS",
+        "1:" + base64.b64encode(os.urandom(32)).decode(),
+    )
+    os.environ.setdefault("AES_LOG_ACTIVE", "1")
+    os.environ["TOKEN_STORE"] = "memory"
+    os.environ["JWT_SIGN_WORKERS"] = "0"
+    os.environ["JWT_KEY_ALG"] = jwt_alg
+    os.environ["AUDIT_SIGNING_ALG"] = jwt_alg
+
+    # Key paths are relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="gateway-micro-"))
+
+
+# ===============================
+# CASES
+# ===============================
+
+def build_cases() -> dict:
+    """name -> zero-argument callable, each exercising one primitive."""
+    import jwt
+    from cryptography.hazmat.primitives import serialization
+
+    from app import crypto_utils
+    from app import auth_utils
+    from app.algorithms import generate_private_key, sign, algorithm_for_key
+    from app.key_manager import generate_jwt_keys, load_private_key, load_public_key
+    from app.audit_signer import generate_signing_keys, sign_root_hash
+
+    generate_jwt_keys()
+    generate_signing_keys()
+
+    cases = {}
+
+    # ---------- audit record ----------
+
+    record = json.dumps({
+        "user_id": "user-0001",
+        "device_id": "device-0001",
+        "action": "ACCESS_GRANTED",
+        "status": "SUCCESS",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "payload": {"path": "/protected"},
+    })
+    enc = crypto_utils.encrypt_log(record)
+    prev_hash = crypto_utils.sha256_hex("GENESIS")
+
+    # Same record in the legacy base64/JSON layout
+    legacy_enc = {
+        "v": enc["v"],
+        "nonce": base64.b64encode(bytes(enc["nonce"])).decode(),
+        "ciphertext": base64.b64encode(bytes(enc["ct"])).decode(),
+    } if "ct" in enc else enc
+
+    cases["encrypt_log"] = lambda: crypto_utils.encrypt_log(record)
+    cases["decrypt_log"] = lambda: crypto_utils.decrypt_log(enc)
+    cases["decrypt_log[legacy]"] = lambda: crypto_utils.decrypt_log(legacy_enc)
+    cases["chain_hash"] = lambda: crypto_utils.chain_hash(prev_hash, enc)
+    cases["chain_hash[legacy]"] = lambda: crypto_utils.chain_hash(prev_hash, legacy_enc)
+
+    # ---------- PoP ----------
+
+    jti = str(uuid.uuid4())
+    message = f"ACCESS:{jti}".encode()
+
+    for alg in ("RS256", "ES256", "EdDSA"):
+        device_key = generate_private_key(alg)
+        pem = device_key.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode()
+        signature = base64.b64encode(sign(device_key, message)).decode()
+
+        cases[f"verify_pop_signature[{alg}]"] = (
+            lambda s=signature, p=pem: auth_utils.verify_pop_signature(message, s, p)
+        )
+
+    # ---------- JWT ----------
+
+    private_key = load_private_key()
+    public_key = load_public_key()
+    alg = algorithm_for_key(private_key)
+    now = int(time.time())
+    payload = {
+        "sub": "user-0001",
+        "device_id": "device-0001",
+        "iat": now,
+        "exp": now + auth_utils.TOKEN_LIFETIME_SECONDS,
+        "jti": jti,
+        "cnf": {"pk": pem},
+    }
+    token = jwt.encode(payload, private_key, algorithm=alg)
+
+    cases[f"jwt.encode[{alg}]"] = lambda: jwt.encode(payload, private_key, algorithm=alg)
+    cases[f"jwt.decode[{alg}]"] = lambda: jwt.decode(token, public_key, algorithms=[alg])
+
+    # Full paths, including token-store bookkeeping
+    cases["generate_token"] = lambda: auth_utils.generate_token("user-0001", "device-0001", pem)
+
+    active = auth_utils.generate_token("user-0002", "device-0002", pem)
+    cases["verify_jwt[cached]"] = lambda: auth_utils.verify_jwt(active)
+
+    # ---------- audit signer ----------
+
+    cases["sign_root_hash"] = lambda: sign_root_hash(prev_hash)
+
+    return cases
+
+
+# ===============================
+# MEASUREMENT
+# ===============================
+
+def measure(fn, repeat: int) -> dict:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    rounds = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    best = min(rounds)
+
+    # Retained blocks, measured without tracemalloc's own bookkeeping
+    blocks_before = sys.getallocatedblocks()
+    for _ in range(ALLOC_CALLS):
+        fn()
+    retained = (sys.getallocatedblocks() - blocks_before) / ALLOC_CALLS
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(ALLOC_CALLS):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": round(1 / best, 1),
+        "us_per_op": round(best * 1e6, 3),
+        "us_per_op_median": round(sorted(rounds)[len(rounds) // 2] * 1e6, 3),
+        "peak_bytes": round(sum(peaks) / len(peaks)),
+        "retained_blocks": round(retained, 2),
+    }
+
+
+def run(args) -> dict:
+    _prepare_env(args.jwt_alg)
+    cases = build_cases()
+
+    results = {}
+    for name, fn in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+
+        results[name] = measure(fn, args.repeat)
+        r = results[name]
+        print(
+            f"  {name:32} {r['ops_per_sec']:>12,.1f} ops/s"
+            f" {r['us_per_op']:>10.2f} us"
+            f" {r['peak_bytes']:>8} B peak",
+            file=sys.stderr,
+        )
+
+    return {
+        "benchmark": "crypto_micro",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"jwt_alg": args.jwt_alg, "repeat": args.repeat},
+        "results": results,
+    }
+
+
+# ===============================
+# COMPARE
+# ===============================
+
+def compare(old: dict, new: dict, threshold: float) -> int:
+    """Print per-primitive deltas; returns the number of regressions."""
+    regressions = 0
+
+    print(f"{'primitive':34} {'old ops/s':>12} {'new ops/s':>12} {'change':>8}  peak B (old -> new)")
+
+    for name in sorted(set(old["results"]) | set(new["results"])):
+        a = old["results"].get(name)
+        b = new["results"].get(name)
+
+        if a is None or b is None:
+            print(f"{name:34} {'only in ' + ('new' if a is None else 'old'):>34}")
+            continue
+
+        change = (b["ops_per_sec"] - a["ops_per_sec"]) / a["ops_per_sec"] * 100
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+
+        print(
+            f"{name:34} {a['ops_per_sec']:>12,.1f} {b['ops_per_sec']:>12,.1f}"
+            f" {change:>+7.1f}%  {a['peak_bytes']} -> {b['peak_bytes']}{flag}"
+        )
+
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Crypto / hashing micro-benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds per primitive")
+    parser.add_argument("--jwt-alg", default="RS256", help="gateway key algorithm: RS256, ES256 or EdDSA")
+    parser.add_argument("--filter", help="only run primitives whose name contains this")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument(
+        "--compare",
+        nargs="+",
+        metavar="REPORT",
+        help="OLD [NEW]: compare against OLD (a fresh run when NEW is omitted)",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="ops/s drop in percent that counts as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes at most two reports")
+
+    # Resolve before the run changes directory
+    output = Path(args.output).resolve() if args.output else None
+    reports = [json.loads(Path(p).read_text()) for p in (args.compare or [])]
+
+    if len(reports) == 2:
+        return 1 if compare(reports[0], reports[1], args.threshold) else 0
+
+    report = run(args)
+
+    if output:
+        output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Report written to {output}", file=sys.stderr)
+    elif not reports:
+        print(json.dumps(report, indent=2))
+
+    if reports:
+        return 1 if compare(reports[0], report, args.threshold) else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+# benchmarks/load_gateway.py
+#
+# Concurrent load generator for the gateway's device flow:
+#
+#   register-device -> issue-token -> (protected -> rotate-token) x cycles
+#
+# Every virtual device holds its own key pair and signs its PoP messages
+# client-side, exactly like client/sign_request.py.
+#
+# Usage (from the repo root):
+#   pip install -r benchmarks/requirements.txt
+#   python -m benchmarks.load_gateway --devices 200 --concurrency 50
+#   python -m benchmarks.load_gateway --output bench.json
+#   python -m benchmarks.load_gateway --url http://127.0.0.1:8000
+#
+# Backends:
+#   stand-in  in-process app, Redis/Mongo replaced by local stand-ins (default)
+#   live      in-process app against REDIS_URL / MONGODB_URI from the env
+#   --url     a running server over HTTP (its own backends and rate limit)
+#
+# req/s for an endpoint = its completed requests / wall time of the phase
+# it ran in. Latencies are in milliseconds.
+
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+
+# ===============================
+# STATS
+# ===============================
+
+def percentile(sorted_values: list, pct: float) -> float:
+    # Nearest-rank
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Recorder:
+    """Latency samples and error counts per endpoint."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.phase_of = {}
+        self.phase_elapsed = {}
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self) -> dict:
+        endpoints = {}
+
+        for endpoint, samples in self.latencies.items():
+            ordered = sorted(samples)
+            elapsed = self.phase_elapsed[self.phase_of[endpoint]]
+            endpoints[endpoint] = {
+                "requests": len(ordered),
+                "errors": self.errors.get(endpoint, 0),
+                "phase": self.phase_of[endpoint],
+                "rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+
+        return endpoints
+
+
+# ===============================
+# VIRTUAL DEVICE
+# ===============================
+
+class Device:
+    def __init__(self, user_id: str, device_id: str, alg: str):
+        from app.algorithms import generate_private_key
+        from cryptography.hazmat.primitives import serialization
+
+        self.user_id = user_id
+        self.device_id = device_id
+        self.private_key = generate_private_key(alg)
+        self.public_key_pem = self.private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode()
+        self.token = None
+
+    def pop_signature(self, action: str) -> str:
+        import jwt
+        from app.algorithms import sign
+
+        # Build EXACT message backend expects
+        jti = jwt.decode(self.token, options={"verify_signature": False})["jti"]
+        signature = sign(self.private_key, f"{action}:{jti}".encode())
+        return base64.b64encode(signature).decode()
+
+
+async def _call(client, recorder: Recorder, endpoint: str, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        resp = await client.request(method, url, **kwargs)
+    except Exception:
+        recorder.record(endpoint, time.perf_counter() - start, ok=False)
+        return None
+
+    recorder.record(endpoint, time.perf_counter() - start, ok=resp.status_code == 200)
+    return resp if resp.status_code == 200 else None
+
+
+async def register(client, recorder, device: Device):
+    await _call(
+        client, recorder, "register-device", "POST", "/register-device",
+        params={
+            "user_id": device.user_id,
+            "device_id": device.device_id,
+            "public_key": device.public_key_pem,
+        },
+    )
+
+
+async def issue(client, recorder, device: Device):
+    resp = await _call(
+        client, recorder, "issue-token", "POST", "/issue-token",
+        params={"user_id": device.user_id, "device_id": device.device_id},
+    )
+    device.token = resp.json()["access_token"] if resp else None
+
+
+async def session(client, recorder, device: Device, cycles: int):
+    # Each token passes the replay guard once, so every protected call
+    # is followed by a rotation
+    for _ in range(cycles):
+        if device.token is None:
+            return
+
+        await _call(
+            client, recorder, "protected", "GET", "/protected",
+            headers={
+                "Authorization": f"Bearer {device.token}",
+                "X-Pop-Signature": device.pop_signature("ACCESS"),
+            },
+        )
+
+        resp = await _call(
+            client, recorder, "rotate-token", "POST", "/rotate-token",
+            headers={
+                "Authorization": f"Bearer {device.token}",
+                "X-Pop-Signature": device.pop_signature("ROTATE"),
+            },
+        )
+        device.token = resp.json()["access_token"] if resp else None
+
+
+async def run_phase(name: str, recorder: Recorder, endpoints: list, devices: list, step, concurrency: int):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(device):
+        async with slots:
+            await step(device)
+
+    for endpoint in endpoints:
+        recorder.phase_of[endpoint] = name
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(d) for d in devices))
+    recorder.phase_elapsed[name] = time.perf_counter() - start
+
+    print(f"  {name}: {recorder.phase_elapsed[name]:.2f}s", file=sys.stderr)
+
+
+async def run_load(client, args) -> Recorder:
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+
+    print(f"Generating {args.devices} {args.key_alg} device keys", file=sys.stderr)
+    devices = [
+        Device(f"bench-{run_id}-{i}", "dev-0", args.key_alg)
+        for i in range(args.devices)
+    ]
+
+    await run_phase(
+        "register", recorder, ["register-device"], devices,
+        lambda d: register(client, recorder, d), args.concurrency,
+    )
+    await run_phase(
+        "issue", recorder, ["issue-token"], devices,
+        lambda d: issue(client, recorder, d), args.concurrency,
+    )
+    await run_phase(
+        "session", recorder, ["protected", "rotate-token"], devices,
+        lambda d: session(client, recorder, d, args.cycles), args.concurrency,
+    )
+
+    return recorder
+
+
+# ===============================
+# TARGETS
+# ===============================
+
+async def run_in_process(args) -> Recorder:
+    import httpx
+
+    if args.backends == "stand-in":
+        from benchmarks.stand_ins import install
+        install()
+
+        # Gateway keys are written relative to the working directory;
+        # keep them out of the checkout
+        os.chdir(tempfile.mkdtemp(prefix="gateway-bench-"))
+
+    # The benchmark measures the pipeline, not the limiter
+    os.environ.setdefault("RATE_LIMIT", "1000000/minute")
+    os.environ.setdefault("RATE_LIMIT_IP", "1000000/minute")
+
+    from app.main import app
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            return await run_load(client, args)
+    finally:
+        await app.router.shutdown()
+
+
+async def run_remote(args) -> Recorder:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        return await run_load(client, args)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Gateway load benchmark")
+    parser.add_argument("--devices", type=int, default=100, help="virtual devices")
+    parser.add_argument("--concurrency", type=int, default=20, help="devices in flight at once")
+    parser.add_argument("--cycles", type=int, default=5, help="protected+rotate rounds per device")
+    parser.add_argument("--key-alg", default="RS256", help="device key algorithm: RS256, ES256 or EdDSA")
+    parser.add_argument("--backends", choices=["stand-in", "live"], default="stand-in")
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process app")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # Resolve before any chdir
+    output = Path(args.output).resolve() if args.output else None
+
+    if args.url:
+        recorder = asyncio.run(run_remote(args))
+        target = args.url
+    else:
+        recorder = asyncio.run(run_in_process(args))
+        target = f"in-process ({args.backends})"
+
+    report = {
+        "benchmark": "load_gateway",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "target": target,
+        "config": {
+            "devices": args.devices,
+            "concurrency": args.concurrency,
+            "cycles": args.cycles,
+            "key_alg": args.key_alg,
+        },
+        "phases": {name: round(s, 4) for name, s in recorder.phase_elapsed.items()},
+        "endpoints": recorder.summary(),
+    }
+
+    text = json.dumps(report, indent=2)
+
+    if output:
+        output.write_text(text + "\n")
+        print(f"Report written to {output}", file=sys.stderr)
+    else:
+        print(text)
+
+    failed = sum(e["errors"] for e in report["endpoints"].values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# benchmarks/stand_ins.py
+#
+# In-process stand-ins for Redis and MongoDB so the benchmarks run
+# offline. install() must run BEFORE anything under app/ is imported,
+# because app.redis_client and app.db connect at import time.
+#
+# Stand-in latencies are not network latencies: compare runs made in
+# the same mode, and use --backends live for absolute numbers.
+
+import os
+import base64
+import secrets
+
+
+def _default_env():
+    # Only fills what the app requires and the caller has not set
+    os.environ.setdefault("MONGODB_URI", "mongodb://stand-in")
+    os.environ.setdefault("MONGO_DB", "gateway_bench")
+    os.environ.setdefault("MONGO_COLLECTION", "audit_logs")
+    os.environ.setdefault("REDIS_URL", "redis://stand-in/0")
+    os.environ.setdefault(
+        "AES_LOG_KEYS",
+        "1:" + base64.b64encode(secrets.token_bytes(32)).decode(),
+    )
+    os.environ.setdefault("AES_LOG_ACTIVE", "1")
+
+
+def install():
+    try:
+        import fakeredis
+        import mongomock
+        import mongomock.store
+        import mongomock_motor
+    except ImportError as e:
+        raise SystemExit(
+            f"stand-in backends need {e.name}: pip install -r benchmarks/requirements.txt"
+        )
+
+    import redis
+    import redis.asyncio
+    import pymongo
+
+    _default_env()
+
+    # One Redis server and one Mongo store shared by the sync and async
+    # clients, as with the real backends
+    redis_server = fakeredis.FakeServer()
+    mongo_store = mongomock.store.ServerStore()
+
+    def sync_redis(cls, url, **kwargs):
+        return fakeredis.FakeRedis(
+            server=redis_server,
+            decode_responses=kwargs.get("decode_responses", False),
+        )
+
+    def async_redis(cls, url, **kwargs):
+        return fakeredis.FakeAsyncRedis(
+            server=redis_server,
+            decode_responses=kwargs.get("decode_responses", False),
+        )
+
+    class MongoClient(mongomock.MongoClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, _store=mongo_store, **kwargs)
+
+    class AsyncMongoClient(mongomock_motor.AsyncMongoMockClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, _store=mongo_store, **kwargs)
+
+        async def close(self):
+            pass
+
+    redis.Redis.from_url = classmethod(sync_redis)
+    redis.asyncio.Redis.from_url = classmethod(async_redis)
+    pymongo.MongoClient = MongoClient
+    pymongo.AsyncMongoClient = AsyncMongoClient
@@ -0,0 +1,123 @@
+import sys
+import json
+import base64
+import hashlib
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, ec
+from cryptography.exceptions import InvalidSignature
+
+# ===============================
+# CONFIG
+# ===============================
+
+VERIFY_KEY_PATH = "keys/audit_signing_pub.pem"
+
+# Usage:
+#   curl http://localhost:8000/admin/audit-logs/42/proof > proof.json
+#   python client/verify_merkle_proof.py proof.json
+
+# ===============================
+# HELPERS
+# ===============================
+
+def leaf_hash(record_hash: str) -> bytes:
+    return hashlib.sha256(b"\x00" + bytes.fromhex(record_hash)).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def compute_root(record_hash: str, proof: list) -> str:
+    node = leaf_hash(record_hash)
+
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        if step["side"] == "left":
+            node = node_hash(sibling, node)
+        else:
+            node = node_hash(node, sibling)
+
+    return node.hex()
+
+
+def leaf_index(proof: list) -> int:
+    # Sibling on the left at depth d means bit d of the position is 1
+    index = 0
+    for depth, step in enumerate(proof):
+        if step["side"] == "left":
+            index |= 1 << depth
+    return index
+
+
+def position_matches(doc: dict, batch: dict) -> bool:
+    size = batch["last_seq"] - batch["first_seq"] + 1
+
+    # Batches are full power-of-two trees: exactly log2(size) steps,
+    # and the path alone fixes which seq the proof is for
+    if size < 1 or size & (size - 1):
+        return False
+    if len(doc["proof"]) != size.bit_length() - 1:
+        return False
+
+    return leaf_index(doc["proof"]) == doc["seq"] - batch["first_seq"]
+
+
+def verify_batch_signature(batch: dict) -> bool:
+    with open(VERIFY_KEY_PATH, "rb") as f:
+        public_key = serialization.load_pem_public_key(f.read())
+
+    # Must match audit_batches.signed_message + audit_signer.sign_root_hash
+    root_message = f"{batch['first_seq']}-{batch['last_seq']}:{batch['root']}"
+    message = f"{root_message}:{batch['timestamp']}".encode()
+
+    signature = base64.b64decode(batch["signature"])
+
+    try:
+        if isinstance(public_key, rsa.RSAPublicKey):
+            public_key.verify(signature, message, padding.PKCS1v15(), hashes.SHA256())
+        elif isinstance(public_key, ec.EllipticCurvePublicKey):
+            public_key.verify(signature, message, ec.ECDSA(hashes.SHA256()))
+        else:
+            public_key.verify(signature, message)   # Ed25519
+        return True
+    except InvalidSignature:
+        return False
+
+
+# ===============================
+# MAIN
+# ===============================
+
+def main(path: str):
+    with open(path) as f:
+        doc = json.load(f)
+
+    batch = doc["batch"]
+
+    in_range = batch["first_seq"] <= doc["seq"] <= batch["last_seq"]
+    position_ok = in_range and position_matches(doc, batch)
+    signature_ok = verify_batch_signature(batch)
+    inclusion_ok = compute_root(doc["hash"], doc["proof"]) == batch["root"]
+
+    print(f"Record seq {doc['seq']} in batch {batch['batch']}")
+    print(f"  Seq within batch range: {in_range}")
+    print(f"  Proof path matches seq: {position_ok}")
+    print(f"  Batch root signature valid: {signature_ok}")
+    print(f"  Inclusion proof valid: {inclusion_ok}")
+
+    if position_ok and signature_ok and inclusion_ok:
+        print("✅ Record is included in the signed batch")
+        return 0
+
+    print("❌ Proof does NOT verify")
+    return 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: verify_merkle_proof.py <proof.json>")
+        sys.exit(2)
+
+    sys.exit(main(sys.argv[1]))